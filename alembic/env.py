@@ -19,7 +19,9 @@ from sqlmodel import SQLModel
 from sqlmodel.sql.sqltypes import AutoString
 
 # --- Your app engine ---
-from app.core.db import engine  # create_engine(...) defined here
+from app.core.db import get_engine  # create_engine(...) defined here
+
+engine = get_engine()
 
 # --- IMPORTANT: import ALL models so they register in SQLModel.metadata ---
 # Do one of the following:
@@ -0,0 +1,115 @@
+"""baseline user and token tables
+
+The schema as the first release's create_all built it: user, and token with
+raw refresh/access token columns. Every later revision builds on it, so an
+empty database reaches the current schema with `alembic upgrade head` alone.
+
+Databases that create_all built back then already have these tables and
+pass through this revision untouched.
+
+Revision ID: 1c0e5d8a7b23
+Revises:
+Create Date: 2026-10-19 14:08:31.276540
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1c0e5d8a7b23"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table("user"):
+        op.create_table(
+            "user",
+            sa.Column("id", sa.Uuid(), nullable=False),
+            sa.Column("first_name", sa.String(length=25), nullable=False),
+            sa.Column("last_name", sa.String(length=25), nullable=False),
+            sa.Column("username", sa.String(length=55), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("password_hash", sa.String(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("is_email_verified", sa.Boolean(), nullable=False),
+            sa.Column(
+                "last_profile_updated_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "last_password_updated_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "updated_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("id"),
+        )
+        op.create_index("ix_user_first_name", "user", ["first_name"], unique=False)
+        op.create_index("ix_user_last_name", "user", ["last_name"], unique=False)
+        op.create_index("ix_user_username", "user", ["username"], unique=True)
+        op.create_index("ix_user_email", "user", ["email"], unique=True)
+
+    if not _has_table("token"):
+        op.create_table(
+            "token",
+            sa.Column("id", sa.Uuid(), nullable=False),
+            sa.Column("user_id", sa.Uuid(), nullable=False),
+            sa.Column("refresh_token", sa.String(), nullable=False),
+            sa.Column("access_token", sa.String(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("user_agent", sa.String(), nullable=True),
+            sa.Column("ip_address", sa.String(length=45), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.Column(
+                "updated_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("id"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("token")
+    op.drop_index("ix_user_email", table_name="user")
+    op.drop_index("ix_user_username", table_name="user")
+    op.drop_index("ix_user_last_name", table_name="user")
+    op.drop_index("ix_user_first_name", table_name="user")
+    op.drop_table("user")
@@ -0,0 +1,51 @@
+"""covering index for the per-user session listing
+
+Adds ix_token_user_id_is_active_created_at on token (user_id, is_active,
+created_at, id) including user_agent, ip_address and access_token_hash, so
+/user/profile/sessions/ pages are index-only seeks instead of OFFSET scans.
+It also serves the user_id lookups of deactivate_all_tokens_for_user.
+
+Revision ID: 3f8a5c2d1e47
+Revises: c41d7e92ab05
+Create Date: 2026-10-18 16:40:12.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f8a5c2d1e47"
+down_revision: Union[str, Sequence[str], None] = "c41d7e92ab05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # user agents were stored uncut so far, INCLUDE values have to fit a btree page
+    op.execute(
+        "UPDATE token SET user_agent = left(user_agent, 512)"
+        " WHERE length(user_agent) > 512"
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_token_user_id_is_active_created_at",
+            "token",
+            ["user_id", "is_active", "created_at", "id"],
+            unique=False,
+            postgresql_include=["user_agent", "ip_address", "access_token_hash"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_token_user_id_is_active_created_at",
+            table_name="token",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,42 @@
+"""key single access token revocations on the jti claim
+
+Adds token.access_token_jti and token_revocation.access_token_jti. A
+revocation keyed on a digest of the token string misses any other spelling
+of the same token (e.g. a re-signed ECDSA signature), the jti doesn't.
+Existing rows keep their digests until they expire.
+
+Revision ID: 5a7e3b9c0d12
+Revises: 8d1c6b4f2a90
+Create Date: 2026-10-19 10:02:17.540981
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5a7e3b9c0d12"
+down_revision: Union[str, Sequence[str], None] = "8d1c6b4f2a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable without default, no table rewrite
+    op.add_column(
+        "token", sa.Column("access_token_jti", sa.String(length=32), nullable=True)
+    )
+    op.add_column(
+        "token_revocation",
+        sa.Column("access_token_jti", sa.String(length=32), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("token_revocation", "access_token_jti")
+    op.drop_column("token", "access_token_jti")
@@ -0,0 +1,62 @@
+"""token version and revocation log
+
+Adds user.token_version (embedded in tokens as "ver") and the append-only
+token_revocation table every worker polls to revoke access tokens in memory.
+
+Revision ID: 6b2a1f38c462
+Revises: 9e9947cc6f74
+Create Date: 2026-10-18 10:02:17.540112
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6b2a1f38c462"
+down_revision: Union[str, Sequence[str], None] = "9e9947cc6f74"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # constant default, no table rewrite on postgres 11+
+    op.add_column(
+        "user",
+        sa.Column("token_version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+    op.create_table(
+        "token_revocation",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("min_token_version", sa.Integer(), nullable=True),
+        sa.Column("access_token_hash", sa.String(length=64), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_index(
+        "ix_token_revocation_created_at",
+        "token_revocation",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_token_revocation_created_at", table_name="token_revocation")
+    op.drop_table("token_revocation")
+    op.drop_column("user", "token_version")
@@ -0,0 +1,65 @@
+"""admin flag and user search indexes
+
+Adds user.is_admin, and for the admin user search a pg_trgm GIN index over
+the search document (names, username and email, see
+app.models.user.SEARCH_DOCUMENT_SQL) plus a (created_at, id) index for
+newest-first keyset pagination.
+
+Revision ID: 8d1c6b4f2a90
+Revises: 3f8a5c2d1e47
+Create Date: 2026-10-18 18:05:44.270391
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d1c6b4f2a90"
+down_revision: Union[str, Sequence[str], None] = "3f8a5c2d1e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must match app.models.user.SEARCH_DOCUMENT_SQL as of this revision
+SEARCH_DOCUMENT_SQL = (
+    "(' ' || first_name || ' ' || last_name || ' ' || username || ' ' || email)"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # constant default, no table rewrite on postgres 11+
+    op.add_column(
+        "user",
+        sa.Column("is_admin", sa.Boolean(), server_default="false", nullable=False),
+    )
+    # trusted since postgres 13, the database owner can create it
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_search_trgm ON "user" '
+            f"USING gin ({SEARCH_DOCUMENT_SQL} gin_trgm_ops)"
+        )
+        op.create_index(
+            "ix_user_created_at_id",
+            "user",
+            ["created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_created_at_id",
+            table_name="user",
+            postgresql_concurrently=True,
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_user_search_trgm")
+    op.drop_column("user", "is_admin")
@@ -0,0 +1,150 @@
+"""store token digests instead of raw JWTs
+
+Replaces token.refresh_token / token.access_token with sha256 hex digests
+and a unique index on refresh_token_hash, so refresh and logout become
+point lookups. Older rows sharing a refresh token digest are deleted, the
+newest one survives. Each step can be re-run after a partial failure.
+
+Schemas create_all builds today are stamped with the head revision instead,
+see app.core.db.create_db_and_tables.
+
+Revision ID: 9e9947cc6f74
+Revises: 1c0e5d8a7b23
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9e9947cc6f74"
+down_revision: Union[str, Sequence[str], None] = "1c0e5d8a7b23"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+BACKFILL_ASSIGNMENTS = (
+    "refresh_token_hash = encode(sha256(convert_to(refresh_token, 'UTF8')), 'hex'), "
+    "access_token_hash = encode(sha256(convert_to(access_token, 'UTF8')), 'hex')"
+)
+
+
+def _has_raw_tokens() -> bool:
+    # a re-run after the raw columns were dropped has nothing left to backfill
+    columns = sa.inspect(op.get_bind()).get_columns("token")
+    return any(column["name"] == "refresh_token" for column in columns)
+
+
+def _drop_invalid_index(name: str) -> None:
+    # a failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    # IF NOT EXISTS would then happily skip
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().scalar(
+        sa.text(
+            """
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+            """
+        ),
+        {"name": name},
+    )
+    if invalid:
+        op.drop_index(
+            name, table_name="token", postgresql_concurrently=True, if_exists=True
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "token",
+        sa.Column("refresh_token_hash", sa.String(length=64), nullable=True),
+        if_not_exists=True,
+    )
+    op.add_column(
+        "token",
+        sa.Column("access_token_hash", sa.String(length=64), nullable=True),
+        if_not_exists=True,
+    )
+
+    # backfill in small committed batches so the table is never locked for long
+    with op.get_context().autocommit_block():
+        if context.is_offline_mode():
+            op.execute(f"UPDATE token SET {BACKFILL_ASSIGNMENTS}")
+        elif _has_raw_tokens():
+            bind = op.get_bind()
+            while True:
+                result = bind.execute(
+                    sa.text(
+                        f"""
+                        UPDATE token SET {BACKFILL_ASSIGNMENTS}
+                        WHERE id IN (
+                            SELECT id FROM token
+                            WHERE refresh_token_hash IS NULL
+                            LIMIT :batch_size
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        """
+                    ),
+                    {"batch_size": BACKFILL_BATCH_SIZE},
+                )
+                if not result.rowcount:
+                    break
+
+    # tokens used to be deterministic, so identical refresh tokens were issued
+    # more than once; keep the newest row per digest so the unique index builds
+    op.execute(
+        """
+        DELETE FROM token USING (
+            SELECT id, row_number() OVER (
+                PARTITION BY refresh_token_hash ORDER BY created_at DESC, id DESC
+            ) AS position
+            FROM token
+            WHERE refresh_token_hash IS NOT NULL
+        ) AS ranked
+        WHERE token.id = ranked.id AND ranked.position > 1
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index("ix_token_refresh_token_hash")
+        op.create_index(
+            "ix_token_refresh_token_hash",
+            "token",
+            ["refresh_token_hash"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+    op.alter_column("token", "refresh_token_hash", nullable=False)
+    op.alter_column("token", "access_token_hash", nullable=False)
+    op.drop_column("token", "refresh_token", if_exists=True)
+    op.drop_column("token", "access_token", if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # raw tokens can't be recovered from their digests, existing sessions are lost
+    op.add_column(
+        "token",
+        sa.Column("access_token", sa.String(), nullable=False, server_default=""),
+    )
+    op.add_column(
+        "token",
+        sa.Column("refresh_token", sa.String(), nullable=False, server_default=""),
+    )
+    op.execute("UPDATE token SET is_active = false")
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_token_refresh_token_hash",
+            table_name="token",
+            postgresql_concurrently=True,
+        )
+    op.drop_column("token", "access_token_hash")
+    op.drop_column("token", "refresh_token_hash")
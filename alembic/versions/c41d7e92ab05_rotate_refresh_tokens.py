@@ -0,0 +1,51 @@
+"""previous refresh token digest for rotation reuse detection
+
+Adds token.previous_refresh_token_hash, set when a refresh token is rotated,
+so presenting an already rotated refresh token can be told apart from an
+unknown one and the session it belongs to revoked.
+
+Revision ID: c41d7e92ab05
+Revises: 6b2a1f38c462
+Create Date: 2026-10-18 14:21:05.903317
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c41d7e92ab05"
+down_revision: Union[str, Sequence[str], None] = "6b2a1f38c462"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable without default, no table rewrite
+    op.add_column(
+        "token",
+        sa.Column("previous_refresh_token_hash", sa.String(length=64), nullable=True),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_token_previous_refresh_token_hash",
+            "token",
+            ["previous_refresh_token_hash"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_token_previous_refresh_token_hash",
+            table_name="token",
+            postgresql_concurrently=True,
+        )
+    op.drop_column("token", "previous_refresh_token_hash")
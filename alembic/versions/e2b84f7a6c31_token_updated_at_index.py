@@ -0,0 +1,45 @@
+"""index token.updated_at for the retention purge
+
+Every purge_tokens_batch selects rows by a range on updated_at (expired, or
+inactive past the grace period). Without an index each batch was a
+sequential scan of the whole token table; with it both conditions are index
+range scans (combined by a BitmapOr).
+
+Revision ID: e2b84f7a6c31
+Revises: 5a7e3b9c0d12
+Create Date: 2026-10-19 11:26:53.804117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2b84f7a6c31"
+down_revision: Union[str, Sequence[str], None] = "5a7e3b9c0d12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_token_updated_at",
+            "token",
+            ["updated_at"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_token_updated_at",
+            table_name="token",
+            postgresql_concurrently=True,
+        )
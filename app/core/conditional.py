@@ -0,0 +1,77 @@
+"""
+Conditional GET helpers: validators for a row version and the 304 check.
+
+A resource's ETag is derived from its id and updated_at, which changes on
+every write to the row, so equal tags mean identical bodies (a strong
+validator) and the check never needs the body itself.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Mapping, Union
+import hashlib
+
+from starlette.responses import Response
+
+# revalidate on every use, and only in the user's own cache
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(
+        "|".join(map(str, parts)).encode(), digest_size=12
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: datetime) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def is_not_modified(
+    headers: Mapping[str, str], etag: str, last_modified: Union[datetime, None]
+) -> bool:
+    """
+    True when the request's validators still match: If-None-Match when present,
+    otherwise If-Modified-Since (to the second, like the header).
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since: Union[datetime, None] = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since is None or since.tzinfo is None:
+        return False
+    return int(last_modified.timestamp()) <= int(since.timestamp())
+
+
+def not_modified_response(headers: Mapping[str, str]) -> Response:
+    # a 304 repeats the validators of the 200 it stands for
+    return Response(status_code=304, headers=headers)
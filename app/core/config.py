@@ -1,7 +1,26 @@
 from pathlib import Path
+from typing import Literal, Optional
+from pydantic import Field, model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+import os
 
+APP_DIR = Path(__file__).parent.parent
 
-class Settings:
+
+class Settings(BaseSettings):
+    """
+    Every field can be set from the environment (or .env) by its upper-cased name.
+    """
+
+    model_config = SettingsConfigDict(
+        # later files win, app/.env overrides the project level one
+        env_file=(str(APP_DIR.parent / ".env"), str(APP_DIR / ".env")),
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+    # "production" turns on https redirect and trusted hosts
+    enviroment: str = "development"
     root_path: str = "/api/v1"
     redirect_slashes: bool = True
     app_title: str = "FastKit"
@@ -9,9 +28,155 @@ class Settings:
         "A modular FastAPI starter kit with PostgreSQL, SQLAlchemy, JWT auth, and WebSocket support."
     )
 
-    class Config:
-        env_file: str = str(Path(__file__).parent.parent / ".env")
-        env_file_encoding: str = "utf-8"
+    # production launcher (python -m app), 0 workers means one per cpu
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 0
+    # seconds in-flight requests get to finish once shutdown starts
+    server_graceful_timeout: float = 30
+
+    # database connection, checked when the engines are built
+    postgres_user: Optional[str] = None
+    postgres_password: Optional[str] = None
+    postgres_host: Optional[str] = None
+    postgres_port: Optional[int] = None
+    postgres_db: Optional[str] = None
+    postgres_async_driver: Literal["asyncpg", "psycopg"] = "asyncpg"
+    sql_echo: bool = False
+    # create missing tables on startup, for dev and tests: defaults to on
+    # outside production, where the schema is managed by alembic migrations
+    # only. A schema created from scratch is stamped with the alembic head
+    db_create_all: Optional[bool] = None
+
+    # read replicas as "host[:port],host[:port]", same credentials and db as the primary
+    postgres_replica_hosts: str = ""
+    # seconds between replica probes, 0 disables them
+    db_replica_health_interval: float = 5
+    # replay lag in seconds above which a replica is ejected, 0 ignores lag
+    db_replica_max_lag: float = 10
+    # seconds an ejected replica stays out of rotation unless a probe readmits it
+    db_replica_eject_seconds: float = 30
+    # seconds a user's reads stay on the primary after they wrote, tracked per
+    # worker by user and across workers by a cookie on the writing client
+    db_replica_pin_seconds: float = 5
+
+    # connection pool, per engine and per worker process
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # seconds to wait for a free connection before giving up
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    # a round trip on every checkout, recycle alone is usually enough under load
+    db_pool_pre_ping: bool = True
+    # server side statement_timeout in ms, 0 leaves the server default
+    db_statement_timeout_ms: int = 0
+    db_application_name: str = "fastkit"
+    # connections each worker opens at startup, 0 leaves it to the first requests
+    db_pool_warmup: int = 1
+    # PgBouncer transaction pooling: no named server-side prepared statements
+    db_pgbouncer: bool = False
+
+    # password hashing pool ("process" or "thread")
+    password_hash_executor: Literal["process", "thread"] = "process"
+    password_hash_workers: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    # jobs running at once, 0 means one per worker
+    password_hash_max_concurrency: int = 0
+    # jobs allowed to wait for a free slot before new ones are rejected
+    password_hash_max_queue: int = 64
+    # start the pool and load bcrypt in it at startup instead of on the first login
+    password_hash_warmup: bool = True
+    # scheme for new hashes, hashes of the other one (or with a lower cost) are
+    # replaced on the next successful login; argon2 needs argon2-cffi installed
+    password_hash_scheme: Literal["bcrypt", "argon2"] = "bcrypt"
+    password_bcrypt_rounds: int = 12
+    password_argon2_memory_kib: int = 19456
+    password_argon2_time_cost: int = 2
+    password_argon2_parallelism: int = 1
+    # > 0: pick the bcrypt rounds / argon2 time cost at startup so one verify
+    # takes about this long here; pin the logged result on mixed hardware
+    password_hash_target_ms: float = 0
+
+    # login/signup throttling, attempts per window (secs), a limit of 0 disables it
+    rate_limit_enabled: bool = True
+    login_rate_limit_ip: int = 30
+    login_rate_limit_account: int = 10
+    login_rate_limit_window: float = 300
+    signup_rate_limit_ip: int = 10
+    signup_rate_limit_account: int = 5
+    signup_rate_limit_window: float = 3600
+    # keys tracked per worker before the least recently used are evicted
+    rate_limit_max_keys: int = 100000
+
+    # authenticated principal cache, per worker; changes reach the other
+    # workers through the revocation sync (REVOCATION_SYNC_INTERVAL)
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 30
+
+    jwt_secret: Optional[str] = None
+    # PEM private key (Ed25519, P-256 or RSA) to sign tokens with instead of
+    # jwt_secret; its public key is published on /.well-known/jwks.json
+    jwt_signing_key_file: Optional[str] = None
+    # comma separated PEM keys that verify tokens and are published without
+    # signing any, see app.core.jwt for rotating keys
+    jwt_verification_key_files: str = ""
+    # secs other services may cache the JWKS
+    jwt_jwks_max_age: int = 300
+    # issue a new refresh token on every refresh, the old one stops working
+    refresh_token_rotation: bool = True
+    # secs a rotated refresh token may still be presented (e.g. concurrent
+    # retries) before it is treated as stolen and its session revoked
+    refresh_token_reuse_grace: float = 10
+
+    # verified JWTs kept per worker until their exp
+    jwt_decode_cache_size: int = 10000
+
+    # token table retention, interval 0 disables the in-app background task
+    token_retention_interval: float = 0
+    token_retention_batch_size: int = 1000
+    token_retention_batch_pause: float = 0.05
+    # how long deactivated tokens are kept around before being purged (secs)
+    token_retention_inactive_grace: float = 86400
+
+    # how often each worker pulls revocations made by other workers (secs)
+    revocation_sync_interval: float = 5
+
+    # websocket gateway, per worker: frames queued per connection before it
+    # counts as a slow consumer, 0 connections means no limit
+    ws_send_queue_size: int = 64
+    ws_max_connections: int = 0
+    ws_max_message_size: int = 64 * 1024
+    # secs between heartbeat sweeps, clients silent for ws_idle_timeout are dropped
+    ws_heartbeat_interval: float = 25
+    ws_idle_timeout: float = 60
+    # compression keeps a zlib context per connection, costly with many idle ones
+    ws_per_message_deflate: bool = False
+
+    # expose prometheus metrics on /metrics
+    metrics_enabled: bool = True
+    # directory the workers share their samples through, so any worker's
+    # /metrics covers all of them; the launcher uses a temporary one when unset
+    metrics_dir: Optional[str] = None
+    # secs between snapshots, other workers' samples are at most this old
+    metrics_snapshot_interval: float = 5
+
+    # per-request sql accounting, budgets of 0 disable the warnings
+    sql_statement_budget: int = 10
+    sql_repeat_threshold: int = 5
+    sql_server_timing: bool = True
+    sql_log_requests: bool = False
+
+    @property
+    def password_hash_concurrency(self) -> int:
+        # derived on read, the launcher resizes password_hash_workers after load
+        if self.password_hash_max_concurrency > 0:
+            return self.password_hash_max_concurrency
+        return self.password_hash_workers
+
+    @model_validator(mode="after")
+    def default_db_create_all(self):
+        if self.db_create_all is None:
+            self.db_create_all = self.enviroment != "production"
+        return self
 
 
 settings = Settings()
@@ -1,20 +1,43 @@
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from urllib.parse import quote_plus
-from typing import Iterator
-import os
+from functools import cache
+from pathlib import Path
+import asyncio
+import logging
+from typing import Iterator, AsyncIterator, Union
+from uuid import uuid4
 
+from app.core.config import settings
+from app.core.metrics import InstrumentedAsyncQueuePool, instrument_pool
+from app.core.query_accounting import install_query_hooks
+from app.core.replicas import ReplicaSet, RoutingSession, parse_replica_hosts
 
-def get_db_url():
-    from dotenv import load_dotenv
+logger = logging.getLogger(__name__)
 
-    load_dotenv()
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
 
+# sqlalchemy dialect+driver used by the async engine, e.g. "asyncpg" or "psycopg"
+ASYNC_DB_DRIVERS = {
+    "asyncpg": "postgresql+asyncpg",
+    "psycopg": "postgresql+psycopg",
+}
+
+
+def get_db_url(
+    drivername: str = "postgresql",
+    query: str = "",
+    host: Union[str, None] = None,
+    port: Union[int, None] = None,
+):
     config = {
-        "pg_username": os.getenv("POSTGRES_USER", None),
-        "pg_password": os.getenv("POSTGRES_PASSWORD", None),
-        "pg_host": os.getenv("POSTGRES_HOST", None),
-        "pg_port": os.getenv("POSTGRES_PORT", None),
-        "pg_db_name": os.getenv("POSTGRES_DB", None),
+        "pg_username": settings.postgres_user,
+        "pg_password": settings.postgres_password,
+        "pg_host": host or settings.postgres_host,
+        "pg_port": port or settings.postgres_port,
+        "pg_db_name": settings.postgres_db,
     }
 
     for config_name, value in config.items():
@@ -28,25 +51,222 @@ def get_db_url():
     port = int(config["pg_port"])
     db = config["pg_db_name"]
 
-    db_connection_url = f"postgresql://{user_enc}:{pass_enc}@{host}:{port}/{db}"
+    db_connection_url = f"{drivername}://{user_enc}:{pass_enc}@{host}:{port}/{db}"
+    if query:
+        db_connection_url += f"?{query}"
 
     return db_connection_url
 
 
-DATABASE_URL = get_db_url()
+def get_async_db_url(host: Union[str, None] = None, port: Union[int, None] = None):
+    query = ""
+    if settings.db_pgbouncer and settings.postgres_async_driver == "asyncpg":
+        # sqlalchemy's own prepared statement cache on top of asyncpg's
+        query = "prepared_statement_cache_size=0"
+    return get_db_url(
+        drivername=ASYNC_DB_DRIVERS[settings.postgres_async_driver],
+        query=query,
+        host=host,
+        port=port,
+    )
+
+
+def get_connect_args(driver: str) -> dict:
+    """
+    Driver specific connect args for application_name, statement_timeout and PgBouncer mode.
+    """
+    timeout = settings.db_statement_timeout_ms
+    if driver == "asyncpg":
+        server_settings = {"application_name": settings.db_application_name}
+        if timeout:
+            server_settings["statement_timeout"] = str(timeout)
+        connect_args = {"server_settings": server_settings}
+        if settings.db_pgbouncer:
+            # transaction pooling hands each transaction a different server
+            # connection, named statements prepared on one aren't on the next
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = (
+                lambda: f"__asyncpg_{uuid4()}__"
+            )
+        return connect_args
+
+    # libpq based drivers (psycopg2 and psycopg 3)
+    connect_args = {"application_name": settings.db_application_name}
+    if timeout:
+        connect_args["options"] = f"-c statement_timeout={timeout}"
+    if settings.db_pgbouncer and driver == "psycopg":
+        connect_args["prepare_threshold"] = None
+    return connect_args
+
+
+def get_pool_options() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        # drops dead connections at the cost of a round trip per checkout
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def build_async_engine(
+    name: str, host: Union[str, None] = None, port: Union[int, None] = None
+):
+    async_engine = create_async_engine(
+        get_async_db_url(host=host, port=port),
+        echo=settings.sql_echo,
+        connect_args=get_connect_args(settings.postgres_async_driver),
+        poolclass=InstrumentedAsyncQueuePool,
+        **get_pool_options(),
+    )
+    instrument_pool(async_engine, name=name)
+    install_query_hooks(async_engine)
+    return async_engine
+
+
+# engines are built on first use: importing the app stays cheap and never
+# imports a DBAPI driver it doesn't need (the app itself never uses psycopg2)
+
+
+@cache
+def get_engine():
+    """
+    Sync engine: used by alembic, scripts and anything running outside the event loop.
+    """
+    return create_engine(
+        get_db_url(),
+        echo=settings.sql_echo,
+        connect_args=get_connect_args("psycopg2"),
+        **get_pool_options(),
+    )
+
+
+@cache
+def get_async_engine():
+    """
+    Async engine: used by every request handler so db round trips never block the loop.
+    """
+    return build_async_engine("primary")
+
+
+@cache
+def get_replicas() -> ReplicaSet:
+    """
+    Optional read replicas, only the read sessionmaker routes to them.
+    """
+    return ReplicaSet(
+        {
+            f"replica{i}": build_async_engine(f"replica{i}", host=host, port=port)
+            for i, (host, port) in enumerate(
+                parse_replica_hosts(settings.postgres_replica_hosts)
+            )
+        },
+        eject_seconds=settings.db_replica_eject_seconds,
+    )
+
+
+@cache
+def get_session_makers() -> tuple:
+    # expire_on_commit=False: attributes stay loaded after commit, an implicit
+    # refresh would need IO which an AsyncSession can't do lazily
+    session_maker = async_sessionmaker(
+        get_async_engine(), class_=AsyncSession, expire_on_commit=False
+    )
+    read_session_maker = async_sessionmaker(
+        get_async_engine(),
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        expire_on_commit=False,
+        replicas=get_replicas(),
+    )
+    return session_maker, read_session_maker
+
 
-engine = create_engine(
-    DATABASE_URL,
-    echo=os.getenv("SQL_ECHO", "0") == "1",
-    pool_pre_ping=True,  # drops dead connections
-    pool_recycle=1800,  # avoids stale connections (secs)
-)
+def async_session_maker() -> AsyncSession:
+    return get_session_makers()[0]()
+
+
+def async_read_session_maker() -> AsyncSession:
+    return get_session_makers()[1]()
+
+
+def _create_all_and_stamp(conn) -> None:
+    """
+    create_all for dev and tests, production schemas come from the alembic
+    migrations only. A schema built here from scratch already matches the
+    newest migration, so it is stamped with the alembic head and a later
+    `alembic upgrade head` only replays revisions added after it.
+    """
+    from alembic.config import Config
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    fresh = not inspect(conn).has_table("user")
+    SQLModel.metadata.create_all(conn)
+
+    context = MigrationContext.configure(conn)
+    if context.get_current_revision() is not None:
+        return
+    if not fresh:
+        # create_all never adds columns, an older schema is behind the models
+        logger.warning(
+            "SCHEMA WAS CREATED BY create_all WITHOUT AN ALEMBIC REVISION, "
+            "RUN `alembic stamp <revision it matches>` BEFORE `alembic upgrade`"
+        )
+        return
+    context.stamp(ScriptDirectory.from_config(Config(str(ALEMBIC_INI))), "head")
 
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    with get_engine().begin() as conn:
+        _create_all_and_stamp(conn)
+
+
+async def create_db_and_tables_async():
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(_create_all_and_stamp)
 
 
 def get_session() -> Iterator[Session]:
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
+        yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    async with async_session_maker() as session:
         yield session
+
+
+async def get_async_read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Session for read-mostly endpoints, selects go to a replica when one is configured.
+    """
+    async with async_read_session_maker() as session:
+        yield session
+
+
+async def warm_up_pool(connections: int) -> None:
+    """
+    Opens up to `connections` pooled connections so the first requests skip the connect.
+    """
+    async_engine = get_async_engine()
+
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # concurrently, so each ping holds a different connection
+    await asyncio.gather(
+        *(ping() for _ in range(min(connections, settings.db_pool_size)))
+    )
+
+
+async def dispose_engines():
+    # only the engines that were actually built
+    if get_replicas.cache_info().currsize:
+        await get_replicas().dispose()
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
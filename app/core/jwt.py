@@ -1,55 +1,491 @@
-from jose import jwt
-import os
-from datetime import datetime, timedelta
+"""
+JWT encoding and verification.
+
+Tokens are signed with one key and verified against a set of keys. The
+default is HS256 with JWT_SECRET, which only this app can check. With
+JWT_SIGNING_KEY_FILE set they are signed with an EdDSA, ES256 or RS256
+private key instead, carry its `kid` and the public keys are published on
+/.well-known/jwks.json so other services verify tokens locally.
+
+    openssl genpkey -algorithm ed25519 -out jwt-2026-10.pem
+    openssl genpkey -algorithm EC -pkeyopt ec_paramgen_curve:P-256 -out ...
+    openssl genpkey -algorithm RSA -pkeyopt rsa_keygen_bits:2048 -out ...
+
+Rotating keys without logging anyone out:
+
+1. add the new key to JWT_VERIFICATION_KEY_FILES and deploy, it is published
+   but signs nothing yet; wait JWT_JWKS_MAX_AGE for consumers to pick it up
+2. make it JWT_SIGNING_KEY_FILE, move the old one to the verification list
+   and deploy
+3. once the longest token lifetime (the refresh token's) has passed, drop
+   the old key
+
+Moving off HS256 is the same from step 2, keeping JWT_SECRET set until the
+HS256 tokens have expired.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import base64
+import hashlib
+import hmac
+import json
+import time
 import logging
-from typing import Union, Dict, Literal
-from app.schemas.token import TokenPayloadSchema
-from uuid import UUID
+from typing import Iterable, Union, Dict, List, Literal
+from uuid import UUID, uuid4
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric.ec import ECDSA
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.asymmetric.utils import (
+    decode_dss_signature,
+    encode_dss_signature,
+)
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
+    load_pem_private_key,
+    load_pem_public_key,
+)
+
+from app.core.cache import TTLCache
+from app.core.conditional import make_etag
+from app.core.config import settings
+from app.core.metrics import jwt_decode_cache_hits_total, jwt_operation_duration_seconds
 
 logger = logging.getLogger(__name__)
 
+TOKEN_LIFETIME_SECONDS = {
+    "access": 1 * 60 * 60,
+    "refresh": 24 * 60 * 60,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class TokenPayload:
+    identity: UUID
+    exp: int
+    type: str
+    jti: Union[str, None] = None
+    ver: int = 0
+
+
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64url_decode(data: bytes) -> bytes:
+    decoded = base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+    # stray characters or set padding bits would give one token several
+    # spellings, each with its own token_digest
+    if _b64url_encode(decoded) != data:
+        raise ValueError("non-canonical base64url")
+    return decoded
+
+
+def _json_dumps(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+
+
+# members that identify a public key, per RFC 7638
+_THUMBPRINT_MEMBERS = {
+    "EC": ("crv", "kty", "x", "y"),
+    "OKP": ("crv", "kty", "x"),
+    "RSA": ("e", "kty", "n"),
+}
+
+
+def jwk_thumbprint(jwk: dict) -> str:
+    required = {name: jwk[name] for name in _THUMBPRINT_MEMBERS[jwk["kty"]]}
+    return _b64url_encode(hashlib.sha256(_json_dumps(required)).digest()).decode()
+
+
+class JWTKey(ABC):
+    """
+    A signing and/or verification key for one algorithm.
+
+    Asymmetric keys are named by their JWK thumbprint, which goes in the
+    token header as `kid` and lets verifiers pick the key without trying all.
+    """
+
+    alg: str
+    kid: Union[str, None] = None
+    can_sign: bool = True
+
+    @abstractmethod
+    def sign(self, signing_input: bytes) -> bytes: ...
+
+    @abstractmethod
+    def verify(self, signing_input: bytes, signature: bytes) -> bool: ...
+
+    def public_jwk(self) -> Union[dict, None]:
+        """
+        The public key as published in the JWKS, None for secret keys.
+        """
+        return None
+
+    def header_segment(self) -> bytes:
+        header = {"alg": self.alg, "typ": "JWT"}
+        if self.kid:
+            header["kid"] = self.kid
+        return _b64url_encode(_json_dumps(header))
+
+
+class HMACKey(JWTKey):
+    alg = "HS256"
+
+    def __init__(self, secret: str):
+        self._key = secret.encode()
+
+    def sign(self, signing_input: bytes) -> bytes:
+        return hmac.new(self._key, signing_input, hashlib.sha256).digest()
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(self.sign(signing_input), signature)
+
+
+def _b64url_uint(value: int, length: int = 0) -> str:
+    length = length or (value.bit_length() + 7) // 8
+    return _b64url_encode(value.to_bytes(length, "big")).decode()
+
+
+class AsymmetricKey(JWTKey):
+    """
+    A `cryptography` private or public key, signing and verifying in native
+    code (tens of microseconds) so neither needs to leave the event loop.
+    """
+
+    def __init__(self, key, private: bool):
+        self._private_key = key if private else None
+        self._public_key = key.public_key() if private else key
+        self.can_sign = private
+        jwk = self._jwk()
+        self.kid = jwk_thumbprint(jwk)
+        self._published = {**jwk, "alg": self.alg, "use": "sig", "kid": self.kid}
+
+    @abstractmethod
+    def _jwk(self) -> dict: ...
+
+    def public_jwk(self) -> dict:
+        return self._published
+
+
+class Ed25519Key(AsymmetricKey):
+    alg = "EdDSA"
+
+    def _jwk(self) -> dict:
+        raw = self._public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return {
+            "kty": "OKP",
+            "crv": "Ed25519",
+            "x": _b64url_encode(raw).decode(),
+        }
+
+    def sign(self, signing_input: bytes) -> bytes:
+        return self._private_key.sign(signing_input)
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        try:
+            self._public_key.verify(signature, signing_input)
+            return True
+        except InvalidSignature:
+            return False
+
+
+class ES256Key(AsymmetricKey):
+    alg = "ES256"
+
+    def _jwk(self) -> dict:
+        numbers = self._public_key.public_numbers()
+        return {
+            "kty": "EC",
+            "crv": "P-256",
+            "x": _b64url_uint(numbers.x, 32),
+            "y": _b64url_uint(numbers.y, 32),
+        }
+
+    def sign(self, signing_input: bytes) -> bytes:
+        # JWS wants r || s, cryptography speaks DER
+        r, s = decode_dss_signature(
+            self._private_key.sign(signing_input, ECDSA(SHA256()))
+        )
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        if len(signature) != 64:
+            return False
+        r = int.from_bytes(signature[:32], "big")
+        s = int.from_bytes(signature[32:], "big")
+        try:
+            self._public_key.verify(
+                encode_dss_signature(r, s), signing_input, ECDSA(SHA256())
+            )
+            return True
+        except InvalidSignature:
+            return False
+
+
+class RS256Key(AsymmetricKey):
+    alg = "RS256"
+
+    def _jwk(self) -> dict:
+        numbers = self._public_key.public_numbers()
+        return {
+            "kty": "RSA",
+            "n": _b64url_uint(numbers.n),
+            "e": _b64url_uint(numbers.e),
+        }
+
+    def sign(self, signing_input: bytes) -> bytes:
+        return self._private_key.sign(signing_input, PKCS1v15(), SHA256())
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        try:
+            self._public_key.verify(signature, signing_input, PKCS1v15(), SHA256())
+            return True
+        except InvalidSignature:
+            return False
+
+
+# smallest RSA modulus accepted, per RFC 7518
+RSA_MIN_KEY_SIZE = 2048
+
+
+def load_pem_key(pem: str) -> AsymmetricKey:
+    """
+    Builds a key from a PEM private or public key, the algorithm follows from
+    its type: Ed25519 is EdDSA, P-256 is ES256 and RSA is RS256.
+    """
+    data = pem.encode()
+    private = b"PRIVATE KEY" in data
+    if private:
+        key = load_pem_private_key(data, password=None)
+    else:
+        key = load_pem_public_key(data)
+
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return Ed25519Key(key, private)
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if not isinstance(key.curve, ec.SECP256R1):
+            raise ValueError(f"unsupported curve {key.curve.name}, use P-256")
+        return ES256Key(key, private)
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        if key.key_size < RSA_MIN_KEY_SIZE:
+            raise ValueError(f"RSA keys need at least {RSA_MIN_KEY_SIZE} bits")
+        return RS256Key(key, private)
+    raise ValueError(f"unsupported key type {type(key).__name__}")
+
+
+def load_pem_key_file(path: str) -> AsymmetricKey:
+    with open(path) as f:
+        return load_pem_key(f.read())
+
+
+class JWTCodec:
+    """
+    Encoder/verifier built once with the key material resolved.
+
+    Tokens are signed with `signing_key` (HS256 with `secret` when none is
+    given) and verified with whichever known key the header names: by `kid`
+    for asymmetric keys, the HS256 key for tokens without one. The header's
+    alg must match the key's, so a public key can never be used as an HMAC
+    secret.
+
+    Tokens that already passed verification are kept in a bounded cache keyed
+    by the full token string (never by signature alone) until their `exp`,
+    so the hot path for a repeat caller is one dict lookup.
+    """
+
+    def __init__(
+        self,
+        secret: Union[str, None] = None,
+        cache_size: int = 10000,
+        signing_key: Union[JWTKey, None] = None,
+        verification_keys: Iterable[JWTKey] = (),
+    ):
+        # tokens without a kid are HS256, checked with JWT_SECRET while it is set
+        self._hmac_key = HMACKey(secret) if secret else None
+        if signing_key is None:
+            if self._hmac_key is None:
+                raise RuntimeError(
+                    "'JWT_SECRET is not not present in the environment variables!"
+                )
+            signing_key = self._hmac_key
+        elif not signing_key.can_sign:
+            raise RuntimeError("the JWT signing key must be a private key")
+
+        self.signing_key = signing_key
+        self.algorithm = signing_key.alg
+        self._header_segment = signing_key.header_segment()
+        self._keys_by_kid: Dict[str, JWTKey] = {}
+        for key in (signing_key, *verification_keys):
+            if key.kid:
+                self._keys_by_kid.setdefault(key.kid, key)
+        # headers we emit ourselves, their tokens skip parsing the header
+        known: List[JWTKey] = list(self._keys_by_kid.values())
+        if self._hmac_key is not None:
+            known.append(self._hmac_key)
+        self._keys_by_header = {key.header_segment(): key for key in known}
+
+        # rendered once, it only changes with a deploy; ordered by kid so every
+        # worker and every step of a rotation renders the same key set the same
+        kids = sorted(self._keys_by_kid)
+        self.jwks = _json_dumps(
+            {"keys": [self._keys_by_kid[kid].public_jwk() for kid in kids]}
+        )
+        self.jwks_etag = make_etag(*kids)
+
+        self._cache = TTLCache(maxsize=cache_size, ttl=0)
+
+    def encode(self, claims: dict) -> str:
+        started = time.perf_counter()
+        signing_input = (
+            self._header_segment + b"." + _b64url_encode(_json_dumps(claims))
+        )
+        token = (
+            signing_input + b"." + _b64url_encode(self.signing_key.sign(signing_input))
+        ).decode()
+        jwt_operation_duration_seconds.observe(time.perf_counter() - started, "encode")
+        return token
+
+    def decode(self, token: str) -> Union[TokenPayload, None]:
+        """
+        Returns the verified payload, or None for malformed, forged or expired tokens.
+        """
+        now = time.time()
+        payload = self._cache.get(token)
+        if payload is not None:
+            jwt_decode_cache_hits_total.inc()
+            return payload if payload.exp >= now else None
+
+        started = time.perf_counter()
+        try:
+            raw = token.encode()
+            signing_input, _, signature = raw.rpartition(b".")
+            header_segment, _, payload_segment = signing_input.partition(b".")
+            if not payload_segment:
+                return None
+
+            key = self._keys_by_header.get(header_segment)
+            if key is None:
+                header = json.loads(_b64url_decode(header_segment))
+                kid = header.get("kid")
+                key = self._keys_by_kid.get(kid) if kid else self._hmac_key
+                if key is None or header.get("alg") != key.alg:
+                    return None
+
+            if not key.verify(signing_input, _b64url_decode(signature)):
+                return None
+
+            claims = json.loads(_b64url_decode(payload_segment))
+            payload = TokenPayload(
+                identity=UUID(claims["identity"]),
+                exp=int(claims["exp"]),
+                type=claims["type"],
+                jti=claims.get("jti"),
+                ver=int(claims.get("ver", 0)),
+            )
+        except Exception as e:
+            logger.error(f"ERR WHILE DECODING TOKEN : {e}")
+            return None
+        finally:
+            jwt_operation_duration_seconds.observe(
+                time.perf_counter() - started, "decode"
+            )
+
+        if payload.exp < now:
+            return None
+
+        self._cache.set(token, payload, ttl=payload.exp - now)
+        return payload
+
+
+def token_digest(token: str) -> str:
+    """
+    Fixed size sha256 hex digest used to store and look up issued tokens.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_jti(token: str) -> Union[str, None]:
+    """
+    The jti claim of a token this app just issued, read without verifying it.
+    """
+    try:
+        payload_segment = token.encode().split(b".")[1]
+        return json.loads(_b64url_decode(payload_segment)).get("jti")
+    except Exception:
+        return None
+
+
+_codec: Union[JWTCodec, None] = None
+
+
+def init_jwt_codec() -> JWTCodec:
+    """
+    Resolves the signing key and builds the codec, called once from the app lifespan.
+    """
+    global _codec
+    signing_key = None
+    if settings.jwt_signing_key_file:
+        signing_key = load_pem_key_file(settings.jwt_signing_key_file)
+    verification_keys = [
+        load_pem_key_file(path.strip())
+        for path in settings.jwt_verification_key_files.split(",")
+        if path.strip()
+    ]
+    _codec = JWTCodec(
+        secret=settings.jwt_secret,
+        cache_size=settings.jwt_decode_cache_size,
+        signing_key=signing_key,
+        verification_keys=verification_keys,
+    )
+    return _codec
+
+
+def get_jwt_codec() -> JWTCodec:
+    return _codec or init_jwt_codec()
+
 
 def generate_token(
-    identity: UUID, token_type: Literal["access", "refresh"], algorithm="HS256"
+    identity: UUID,
+    token_type: Literal["access", "refresh"],
+    algorithm: Union[str, None] = None,
+    version: int = 0,
 ) -> Union[None | Dict]:
     try:
-        secret = os.getenv("JWT_SECRET", None)
-        if not secret:
-            raise Exception(
-                "'JWT_SECRET is not not present in the environment variables!"
-            )
-
-        if token_type == "access":
-            expire_after_hours = 1
-        elif token_type == "refresh":
-            expire_after_hours = 24
+        codec = get_jwt_codec()
+        if algorithm is not None and algorithm != codec.algorithm:
+            raise Exception(f"unsupported algorithm {algorithm!r}")
 
-        access_token_expires = datetime.now() + timedelta(hours=expire_after_hours)
-        token = jwt.encode(
+        expire_after_seconds = TOKEN_LIFETIME_SECONDS[token_type]
+        return codec.encode(
             {
                 "identity": str(identity),
-                "exp": int(access_token_expires.timestamp()),
+                "exp": int(time.time()) + expire_after_seconds,
                 "type": token_type,
-            },
-            secret,
-            algorithm=algorithm,
+                # unique per token, two logins in the same second must not collide
+                "jti": uuid4().hex,
+                # user's token_version at issue time, see app.core.revocation
+                "ver": version,
+            }
         )
-
-        return token
     except Exception as e:
         logger.error(f"ERR WHILE GENERATING TOKEN : {e}")
         return None
 
 
-def decode_token(token: str, algorithm="HS256") -> Union[None | TokenPayloadSchema]:
+def decode_token(
+    token: str, algorithm: Union[str, None] = None
+) -> Union[None | TokenPayload]:
     try:
-        secret = os.getenv("JWT_SECRET", None)
-        if not secret:
-            raise Exception(
-                "'JWT_SECRET is not not present in the environment variables!"
-            )
-        payload = jwt.decode(token=token, algorithms=algorithm, key=secret)
-        return TokenPayloadSchema(**payload)
+        codec = get_jwt_codec()
+        if algorithm is not None and algorithm != codec.algorithm:
+            raise Exception(f"unsupported algorithm {algorithm!r}")
+        return codec.decode(token)
     except Exception as e:
         logger.error(f"ERR WHILE DECODING TOKEN : {e}")
         return None
@@ -0,0 +1,369 @@
+"""
+Minimal in-process Prometheus metrics.
+
+Every worker keeps its own series and all updates happen on that worker's
+event loop, so recording is a dict lookup plus an increment with no locks.
+Series carry a `worker` label (the pid) so scrapes of different workers
+never get mixed up.
+
+With several workers behind one socket a scrape lands on any of them, so
+when METRICS_DIR is set (the launcher sets it up for its workers) each
+worker writes its samples there every METRICS_SNAPSHOT_INTERVAL seconds,
+and /metrics serves its own live samples plus the other workers' latest
+snapshots.
+"""
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple
+import logging
+import os
+
+import orjson
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# seconds, tuned for request handling, db waits and hashing alike
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    # read at render time, workers forked from a preloaded parent share imports
+    pairs.append(f'worker="{os.getpid()}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge read from callbacks at scrape time, nothing to update on the hot path.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._callbacks: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, callback: Callable[[], float], *labels: str) -> None:
+        self._callbacks[labels] = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, callback in self._callbacks.items():
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+        # non-cumulative per bucket, summed up at render time
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[-2]
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {series[-1]}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def samples(self) -> Dict[str, List[str]]:
+        """
+        Sample lines per metric, without the HELP and TYPE header.
+        """
+        return {name: metric.render()[2:] for name, metric in self._metrics.items()}
+
+    def render(self, others: Sequence[Dict[str, List[str]]] = ()) -> str:
+        """
+        Exposition text of this worker, with the samples of `others` (see
+        samples()) merged in under the same headers.
+        """
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.render())
+            for other in others:
+                lines.extend(other.get(name, ()))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"{pid}.json")
+
+
+def write_snapshot(directory: str) -> None:
+    path = _snapshot_path(directory, os.getpid())
+    # written aside and renamed, readers never see half a file
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(orjson.dumps(registry.samples()))
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_snapshot(directory: str) -> None:
+    try:
+        os.remove(_snapshot_path(directory, os.getpid()))
+    except FileNotFoundError:
+        pass
+
+
+def read_snapshots(directory: str) -> List[Dict[str, List[str]]]:
+    """
+    Latest samples of the other live workers. Snapshots of workers that died
+    are deleted, their series end with them.
+    """
+    snapshots = []
+    for entry in os.listdir(directory):
+        stem, ext = os.path.splitext(entry)
+        if ext != ".json" or not stem.isdigit():
+            continue
+        pid = int(stem)
+        if pid == os.getpid():
+            continue
+        path = os.path.join(directory, entry)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        except PermissionError:
+            # alive, the pid was reused by a process of another user
+            continue
+        try:
+            with open(path, "rb") as f:
+                snapshots.append(orjson.loads(f.read()))
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.error(f"ERR READING METRICS SNAPSHOT {entry}: {e}")
+    return snapshots
+
+
+http_requests_total = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests handled.",
+        ("method", "route", "status"),
+    )
+)
+http_request_duration_seconds = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency.",
+        ("method", "route"),
+    )
+)
+app_startup_phase_seconds = registry.register(
+    Gauge(
+        "app_startup_phase_seconds",
+        "Time spent in each startup phase of this worker.",
+        ("phase",),
+    )
+)
+db_pool_checkout_wait_seconds = registry.register(
+    Histogram(
+        "db_pool_checkout_wait_seconds",
+        "Time spent getting a connection from the pool, opening new ones included.",
+    )
+)
+db_pool_checkouts_total = registry.register(
+    Counter(
+        "db_pool_checkouts_total", "Connections checked out of the pool.", ("engine",)
+    )
+)
+db_pool_connects_total = registry.register(
+    Counter("db_pool_connects_total", "New database connections opened.", ("engine",))
+)
+db_pool_invalidations_total = registry.register(
+    Counter(
+        "db_pool_invalidations_total", "Pooled connections invalidated.", ("engine",)
+    )
+)
+db_pool_size = registry.register(
+    Gauge("db_pool_size", "Configured pool size.", ("engine",))
+)
+db_pool_checked_out = registry.register(
+    Gauge("db_pool_checked_out", "Connections in use.", ("engine",))
+)
+db_pool_overflow = registry.register(
+    Gauge("db_pool_overflow", "Connections opened beyond the pool size.", ("engine",))
+)
+db_replica_ejections_total = registry.register(
+    Counter(
+        "db_replica_ejections_total",
+        "Read replicas taken out of rotation after connection errors.",
+        ("engine",),
+    )
+)
+db_replicas_healthy = registry.register(
+    Gauge("db_replicas_healthy", "Read replicas currently in rotation.")
+)
+password_hash_duration_seconds = registry.register(
+    Histogram(
+        "password_hash_duration_seconds",
+        "Time spent in bcrypt, excluding queueing.",
+        ("operation",),
+    )
+)
+password_hash_queue_wait_seconds = registry.register(
+    Histogram(
+        "password_hash_queue_wait_seconds",
+        "Time password jobs waited for a free slot.",
+    )
+)
+password_hash_rejected_total = registry.register(
+    Counter(
+        "password_hash_rejected_total",
+        "Password jobs rejected because the queue was full.",
+    )
+)
+rate_limited_total = registry.register(
+    Counter("rate_limited_total", "Requests rejected by a rate limit.", ("rule",))
+)
+websocket_connections = registry.register(
+    Gauge("websocket_connections", "Open websocket connections.")
+)
+websocket_frames_sent_total = registry.register(
+    Counter("websocket_frames_sent_total", "Frames written to websocket clients.")
+)
+websocket_evictions_total = registry.register(
+    Counter(
+        "websocket_evictions_total",
+        "Websocket connections closed by the server.",
+        ("reason",),
+    )
+)
+jwt_operation_duration_seconds = registry.register(
+    Histogram(
+        "jwt_operation_duration_seconds",
+        "Time spent signing or verifying tokens, cache hits excluded.",
+        ("operation",),
+        buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001),
+    )
+)
+jwt_decode_cache_hits_total = registry.register(
+    Counter("jwt_decode_cache_hits_total", "Token decodes answered from the cache.")
+)
+
+
+class _TimedCheckoutMixin:
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait_seconds.observe(perf_counter() - started)
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    """
+    QueuePool that records how long every checkout waited.
+    """
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long every checkout waited.
+    """
+
+
+def instrument_pool(engine, name: str = "primary") -> None:
+    """
+    Registers pool gauges and event listeners for a (sync or async) engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    # read sync_engine.pool every time, dispose() swaps the pool object
+    db_pool_size.set_function(lambda: sync_engine.pool.size(), name)
+    db_pool_checked_out.set_function(lambda: sync_engine.pool.checkedout(), name)
+    db_pool_overflow.set_function(lambda: sync_engine.pool.overflow(), name)
+
+    # listeners on the engine follow it to every pool it creates
+    event.listen(sync_engine, "checkout", lambda *_: db_pool_checkouts_total.inc(name))
+    event.listen(sync_engine, "connect", lambda *_: db_pool_connects_total.inc(name))
+    event.listen(
+        sync_engine, "invalidate", lambda *_: db_pool_invalidations_total.inc(name)
+    )
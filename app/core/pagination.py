@@ -0,0 +1,34 @@
+"""
+Opaque cursors for keyset pagination.
+
+A page ends with the sort key of its last row; the next page asks for rows
+strictly after it (`WHERE (created_at, id) < (:created_at, :id)` for a
+newest-first listing), which an index on the sort columns answers by seeking
+straight to it, where OFFSET would walk and discard every earlier row.
+"""
+
+from datetime import datetime
+from typing import Union
+from uuid import UUID
+import base64
+import binascii
+import json
+
+from app.core.responses import dumps
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    raw = dumps([created_at.isoformat(), str(row_id)])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Union[tuple, None]:
+    """
+    Returns (created_at, id) from encode_cursor, or None when the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
@@ -0,0 +1,88 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Union
+from uuid import UUID
+
+from app.core.cache import TTLCache
+from app.core.conditional import make_etag, validator_headers
+from app.core.config import settings
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    Immutable snapshot of the authenticated user, detached from any session.
+    Deliberately leaves out password_hash.
+    """
+
+    id: UUID
+    username: str
+    email: str
+    first_name: str
+    last_name: str
+    is_active: bool
+    is_email_verified: bool
+    is_admin: bool
+    created_at: datetime
+    updated_at: datetime
+    last_profile_updated_at: datetime
+    last_password_updated_at: datetime
+    # response body built once per principal, see serialized()
+    _serialized: Union[dict, None] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # conditional GET headers, see validators()
+    _validators: Union[dict, None] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            is_active=user.is_active,
+            is_email_verified=user.is_email_verified,
+            is_admin=user.is_admin,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+            last_profile_updated_at=user.last_profile_updated_at,
+            last_password_updated_at=user.last_password_updated_at,
+        )
+
+    def get_full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+    def serialized(self, serializer: Callable[["Principal"], dict]) -> dict:
+        """
+        Returns serializer(self), computed on first use since a principal never changes.
+        The dict is shared between requests and must not be mutated.
+        """
+        if self._serialized is None:
+            object.__setattr__(self, "_serialized", serializer(self))
+        return self._serialized
+
+    def validators(self) -> dict:
+        """
+        ETag, Last-Modified and Cache-Control headers for this version of the
+        user, computed on first use. Shared like serialized(), don't mutate.
+        """
+        if self._validators is None:
+            headers = validator_headers(
+                make_etag(self.id, self.updated_at), self.updated_at
+            )
+            object.__setattr__(self, "_validators", headers)
+        return self._validators
+
+
+# user id -> Principal
+principal_cache = TTLCache(
+    maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl
+)
+
+
+def invalidate_principal(user_id: UUID) -> None:
+    principal_cache.pop(user_id)
@@ -0,0 +1,54 @@
+"""
+Per-request SQL accounting.
+
+Cursor execute hooks on the engine add every statement's count and duration
+to the QueryStats of the request being served, found through a context
+variable that SQLAlchemy's greenlets share with the calling task.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, Union
+
+from sqlalchemy import event
+
+
+@dataclass(slots=True)
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    # statement text -> executions, repeated statements hint at N+1 queries
+    statements: Dict[str, int] = field(default_factory=dict)
+
+    def most_repeated(self) -> tuple:
+        if not self.statements:
+            return ("", 0)
+        return max(self.statements.items(), key=lambda item: item[1])
+
+
+current_query_stats: ContextVar[Union[QueryStats, None]] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started_at = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is None:
+        return
+    stats.count += 1
+    stats.duration += perf_counter() - context._query_started_at
+    stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+
+def install_query_hooks(engine) -> None:
+    """
+    Attaches the accounting hooks to a (sync or async) engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,138 @@
+"""
+Request throttling for the expensive unauthenticated endpoints.
+
+Every RateLimit counts hits per key (client ip, normalized email, ...) with
+a sliding window counter: the previous fixed window's count is weighted by
+how much of it still overlaps the sliding window, which needs three numbers
+per key instead of a timestamp per hit.
+
+Counts live in a RateLimitBackend. The default one keeps them in this
+worker's memory (bounded, least recently used keys are evicted), so with N
+workers a client gets up to N times the limit; a shared backend (e.g. Redis)
+can be plugged in with set_rate_limit_backend.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Union
+import math
+import time
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import rate_limited_total
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request goes over a rate limit, answered with a 429.
+    """
+
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(f"rate limit {rule!r} exceeded")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for the hit counts, shared backends implement hit() over the network.
+    """
+
+    @abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        """
+        Counts a hit for `key` unless it would go over `limit` per `window` seconds.
+        Returns 0 when the hit was counted, otherwise the seconds until it would be allowed.
+        """
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, maxsize: int = 100000, timer: Callable[[], float] = time.time):
+        self._timer = timer
+        # key -> [window number, previous window count, current window count]
+        self._counts = TTLCache(maxsize=maxsize, ttl=0, timer=timer)
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = self._timer()
+        number, elapsed = divmod(now, window)
+        counts = self._counts.get(key)
+
+        if counts is None or counts[0] < number - 1:
+            previous, current = 0, 0
+        elif counts[0] == number - 1:
+            previous, current = counts[2], 0
+        else:
+            previous, current = counts[1], counts[2]
+
+        weight = 1 - elapsed / window
+        if previous * weight + current + 1 > limit:
+            return self._retry_after(previous, current, limit, window, elapsed)
+
+        # two windows: the count is still needed as "previous" in the next one
+        self._counts.set(key, [number, previous, current + 1], ttl=2 * window)
+        return 0
+
+    @staticmethod
+    def _retry_after(
+        previous: int, current: int, limit: int, window: float, elapsed: float
+    ) -> float:
+        # in this window: previous * (1 - t / window) + current + 1 <= limit
+        if previous and current + 1 <= limit:
+            at = window * (1 - (limit - current - 1) / previous)
+            return max(at - elapsed, 0.001)
+        # next window, where the current count becomes the weighted one
+        at = window * (1 - (limit - 1) / current) if current else 0
+        return window - elapsed + max(at, 0)
+
+
+_backend: RateLimitBackend = MemoryRateLimitBackend(
+    maxsize=settings.rate_limit_max_keys
+)
+
+
+def set_rate_limit_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimit:
+    name: str
+    limit: int
+    window: float
+
+    async def hit(self, key: Union[str, None]) -> None:
+        """
+        Counts a hit for `key`, raising RateLimitExceeded when over the limit.
+        Limits of 0 and missing keys are not enforced.
+        """
+        if self.limit <= 0 or not key or not settings.rate_limit_enabled:
+            return
+        retry_after = await _backend.hit(f"{self.name}:{key}", self.limit, self.window)
+        if retry_after:
+            rate_limited_total.inc(self.name)
+            raise RateLimitExceeded(self.name, math.ceil(retry_after))
+
+
+login_ip_limit = RateLimit(
+    "login_ip", settings.login_rate_limit_ip, settings.login_rate_limit_window
+)
+login_account_limit = RateLimit(
+    "login_account",
+    settings.login_rate_limit_account,
+    settings.login_rate_limit_window,
+)
+signup_ip_limit = RateLimit(
+    "signup_ip", settings.signup_rate_limit_ip, settings.signup_rate_limit_window
+)
+signup_account_limit = RateLimit(
+    "signup_account",
+    settings.signup_rate_limit_account,
+    settings.signup_rate_limit_window,
+)
+
+
+def normalize_identifier(value: Union[str, None]) -> str:
+    # same folding as the signup schema, so case or spacing can't dodge a limit
+    return "".join((value or "").split()).lower()
@@ -0,0 +1,227 @@
+"""
+Read replica routing.
+
+Sessions from the read sessionmaker pick one healthy replica when they are
+created and send plain SELECTs there, anything else (flushes, UPDATE/DELETE,
+SELECT ... FOR UPDATE, text) goes to the primary and keeps the rest of the
+session on it. A replica that is unreachable or lagging is left out of
+rotation for a while (see ReplicaSet.check), and users who just wrote are
+read from the primary for a short window so they see their own changes
+despite replication lag.
+
+The health state and the per-user write pins live in each worker's memory.
+So that a write on one worker is also read back on another, the client
+carries its pin too: ReadYourWritesMiddleware sets a short-lived cookie on
+responses to requests that wrote, and every session of a request that
+presents it reads from the primary.
+"""
+
+from contextvars import ContextVar
+from itertools import count
+from typing import Callable, Dict, Sequence, Union
+from uuid import UUID
+import logging
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import Select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import db_replica_ejections_total, db_replicas_healthy
+
+logger = logging.getLogger(__name__)
+
+# seconds of replay lag, 0 when everything received has been replayed so an
+# idle primary doesn't look like a lagging replica
+LAG_QUERY = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+class ReplicaSet:
+    """
+    Round-robin over replica engines, skipping ejected ones until they are due back.
+    """
+
+    def __init__(
+        self,
+        engines: Dict[str, AsyncEngine],
+        eject_seconds: float = 30,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.engines = engines
+        self.eject_seconds = eject_seconds
+        self._timer = timer
+        self._names = list(engines)
+        self._next = count()
+        # name -> monotonic time it may be used again
+        self._ejected: Dict[str, float] = {}
+
+        for name, engine in engines.items():
+            event.listen(engine.sync_engine, "handle_error", self._on_error(name))
+        db_replicas_healthy.set_function(self.healthy_count)
+
+    def __bool__(self) -> bool:
+        return bool(self._names)
+
+    def healthy_count(self) -> int:
+        now = self._timer()
+        return sum(1 for name in self._names if self._ejected.get(name, 0) <= now)
+
+    def choose(self) -> Union[AsyncEngine, None]:
+        """
+        Returns the next healthy replica, or None when all of them are ejected.
+        """
+        now = self._timer()
+        for _ in range(len(self._names)):
+            name = self._names[next(self._next) % len(self._names)]
+            if self._ejected.get(name, 0) <= now:
+                self._ejected.pop(name, None)
+                return self.engines[name]
+        return None
+
+    def eject(self, name: str, reason: str = "") -> None:
+        if name not in self._ejected:
+            logger.warning(f"EJECTING READ REPLICA {name}: {reason}")
+            db_replica_ejections_total.inc(name)
+        self._ejected[name] = self._timer() + self.eject_seconds
+
+    def readmit(self, name: str) -> None:
+        if self._ejected.pop(name, None) is not None:
+            logger.info(f"READ REPLICA {name} BACK IN ROTATION")
+
+    def _on_error(self, name: str):
+        def handle_error(context):
+            # dropped connections only, query errors say nothing about the replica
+            if context.is_disconnect:
+                self.eject(name, reason="connection lost")
+
+        return handle_error
+
+    async def check(self, max_lag: float = 0) -> None:
+        """
+        Probes every replica, ejecting unreachable or lagging ones and readmitting
+        the rest. Refused connects never reach handle_error, this is what catches them.
+        """
+        for name, engine in self.engines.items():
+            try:
+                async with engine.connect() as conn:
+                    lag = (await conn.execute(text(LAG_QUERY))).scalar() or 0
+            except Exception as e:
+                self.eject(name, reason=str(e))
+                continue
+
+            if max_lag > 0 and lag > max_lag:
+                self.eject(name, reason=f"{lag:.1f}s behind the primary")
+            else:
+                self.readmit(name)
+
+    async def dispose(self) -> None:
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+class RequestPin:
+    """
+    Read pin state of one request: `pinned` when the client wrote recently
+    (on any worker), `wrote` once this request writes.
+    """
+
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# set by ReadYourWritesMiddleware for the duration of an http request
+current_request_pin: ContextVar[Union[RequestPin, None]] = ContextVar(
+    "current_request_pin", default=None
+)
+
+
+class RoutingSession(Session):
+    """
+    Session that reads from a replica until it writes, see the module docstring.
+    """
+
+    def __init__(self, *args, replicas: Union[ReplicaSet, None] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        pin = current_request_pin.get()
+        if pin is not None and pin.pinned:
+            replicas = None
+        replica = replicas.choose() if replicas else None
+        self.replica = replica.sync_engine if replica is not None else None
+
+    def use_primary(self) -> None:
+        self.replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica is not None:
+            if (
+                not self._flushing
+                and isinstance(clause, Select)
+                and clause._for_update_arg is None
+            ):
+                return self.replica
+            # the session wrote, it reads its own writes from now on
+            self.replica = None
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+# user id -> True while their reads must stay on the primary
+recent_writers = TTLCache(
+    maxsize=settings.principal_cache_size, ttl=settings.db_replica_pin_seconds
+)
+
+
+def pin_to_primary(user_id: UUID) -> None:
+    recent_writers.set(user_id, True)
+    pin = current_request_pin.get()
+    if pin is not None:
+        # the response hands the pin to the client, see ReadYourWritesMiddleware
+        pin.wrote = True
+
+
+def is_request_pinned() -> bool:
+    """
+    True when the current request carries a read pin, i.e. its client wrote
+    recently, possibly on another worker.
+    """
+    pin = current_request_pin.get()
+    return pin is not None and pin.pinned
+
+
+def use_primary_if_pinned(session: AsyncSession, user_id: UUID) -> bool:
+    """
+    Moves a replica-routed session to the primary if the user wrote recently.
+    Returns True when it did, so rows already read can be refreshed.
+    """
+    sync_session = session.sync_session
+    if getattr(sync_session, "replica", None) is None:
+        return False
+    if user_id not in recent_writers:
+        return False
+    sync_session.use_primary()
+    return True
+
+
+def parse_replica_hosts(value: str) -> Sequence[tuple]:
+    """
+    "host1,host2:5433" -> [("host1", None), ("host2", 5433)]
+    """
+    hosts = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(":")
+        hosts.append((host, int(port) if port else None))
+    return hosts
@@ -0,0 +1,53 @@
+"""
+App-wide JSON response class.
+
+Renders with orjson when it is installed and falls back to the stdlib json
+module otherwise; the fallback handles the same UUID and datetime values
+orjson serializes natively, so responses look the same either way.
+"""
+
+from datetime import date, datetime
+from typing import Any
+from uuid import UUID
+import json
+
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content)
+
+else:
+
+    def dumps(content: Any) -> bytes:
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+            default=_default,
+        ).encode("utf-8")
+
+
+class JSONResponse(StarletteJSONResponse):
+    """
+    Drop-in JSONResponse, used as the app's default_response_class too.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
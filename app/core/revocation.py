@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Dict, Tuple, Union
+from uuid import UUID
+import time
+
+from app.core.jwt import TokenPayload, token_digest
+
+
+class RevocationMap:
+    """
+    In-memory view of the token_revocation table for one worker.
+
+    Entries are only needed until the access tokens they cover expire, so the
+    map stays as small as the revocations of the last access token lifetime.
+    """
+
+    def __init__(self):
+        # user id -> (min valid token version, expires at)
+        self._versions: Dict[UUID, Tuple[int, float]] = {}
+        # access token jti -> expires at
+        self._jtis: Dict[str, float] = {}
+        # access token digest -> expires at, for rows revoked before jtis were
+        # stored; a digest only matches the exact spelling of the token
+        self._tokens: Dict[str, float] = {}
+        # created_at of the newest row applied, the next sync starts from it
+        self.last_seen: Union[datetime, None] = None
+
+    def revoke_user(self, user_id: UUID, min_version: int, expires_at: float) -> None:
+        current = self._versions.get(user_id)
+        if current is None or current[0] < min_version:
+            self._versions[user_id] = (min_version, expires_at)
+
+    def revoke_access_token(
+        self,
+        jti: Union[str, None],
+        access_token_hash: Union[str, None],
+        expires_at: float,
+    ) -> None:
+        if jti:
+            self._jtis[jti] = expires_at
+        elif access_token_hash:
+            self._tokens[access_token_hash] = expires_at
+
+    def apply(self, revocation) -> None:
+        expires_at = revocation.expires_at.timestamp()
+        if revocation.min_token_version is not None:
+            self.revoke_user(
+                revocation.user_id, revocation.min_token_version, expires_at
+            )
+        self.revoke_access_token(
+            revocation.access_token_jti, revocation.access_token_hash, expires_at
+        )
+        if self.last_seen is None or revocation.created_at > self.last_seen:
+            self.last_seen = revocation.created_at
+
+    def is_revoked(self, payload: TokenPayload, token: str) -> bool:
+        entry = self._versions.get(payload.identity)
+        if entry is not None and payload.ver < entry[0]:
+            return True
+        if payload.jti is not None and payload.jti in self._jtis:
+            return True
+        # only hash the token when something could match
+        return bool(self._tokens) and token_digest(token) in self._tokens
+
+    def prune(self, now: Union[float, None] = None) -> None:
+        now = time.time() if now is None else now
+        for user_id in [k for k, v in self._versions.items() if v[1] <= now]:
+            del self._versions[user_id]
+        for jti in [k for k, v in self._jtis.items() if v <= now]:
+            del self._jtis[jti]
+        for digest in [k for k, v in self._tokens.items() if v <= now]:
+            del self._tokens[digest]
+
+
+revocations = RevocationMap()
@@ -0,0 +1,280 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from typing import Any, Callable, Tuple, Union
+import asyncio
+import math
+import time
+import logging
+
+from app.core.config import settings
+from app.core.metrics import (
+    password_hash_duration_seconds,
+    password_hash_queue_wait_seconds,
+    password_hash_rejected_total,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# settings the hashing policy is built from, handed to the pool processes
+HASH_SETTINGS = (
+    "password_hash_scheme",
+    "password_bcrypt_rounds",
+    "password_argon2_memory_kib",
+    "password_argon2_time_cost",
+    "password_argon2_parallelism",
+)
+# calibration never goes below these
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 20
+MIN_ARGON2_TIME_COST = 1
+MAX_ARGON2_TIME_COST = 50
+
+
+@cache
+def get_pwd_context():
+    """
+    Built on first use, importing passlib and loading the bcrypt backend slows down boot.
+
+    New hashes use the configured scheme and cost. needs_update() flags
+    hashes of the other scheme and weaker bcrypt hashes (stronger ones are
+    kept, so workers calibrated a round apart don't rehash back and forth);
+    for argon2 passlib flags any parameter change.
+    """
+    from passlib.context import CryptContext
+
+    scheme = settings.password_hash_scheme
+    other = "argon2" if scheme == "bcrypt" else "bcrypt"
+    return CryptContext(
+        schemes=[scheme, other],
+        deprecated="auto",
+        bcrypt__default_rounds=settings.password_bcrypt_rounds,
+        bcrypt__min_rounds=settings.password_bcrypt_rounds,
+        argon2__memory_cost=settings.password_argon2_memory_kib,
+        argon2__default_rounds=settings.password_argon2_time_cost,
+        argon2__parallelism=settings.password_argon2_parallelism,
+    )
+
+
+def check_password_hash_backend() -> None:
+    """
+    Refuses to start when the configured scheme has no backend here (argon2
+    without argon2-cffi), instead of failing every login with a 500.
+    """
+    from passlib.exc import MissingBackendError
+
+    scheme = settings.password_hash_scheme
+    try:
+        get_pwd_context().handler(scheme).get_backend()
+    except MissingBackendError as e:
+        raise RuntimeError(
+            f"PASSWORD_HASH_SCHEME={scheme} but no backend for it is installed: {e}"
+        ) from e
+
+
+def _apply_hash_settings(values: dict) -> None:
+    # pool initializer, spawned (not forked) processes would miss a calibration
+    for name, value in values.items():
+        setattr(settings, name, value)
+    get_pwd_context.cache_clear()
+
+
+def _best_time(fn: Callable[[], Any], samples: int) -> float:
+    best = math.inf
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def calibrate_password_hash(target_ms: float, samples: int = 3) -> int:
+    """
+    Sets the cost of the configured scheme so one hash/verify takes about
+    `target_ms` (rounded down) on this machine and returns it. bcrypt doubles
+    per round, argon2 grows linearly with the time cost at a fixed memory cost.
+    """
+    target = target_ms / 1000
+    if settings.password_hash_scheme == "bcrypt":
+        from passlib.hash import bcrypt
+
+        base = 8
+        handler = bcrypt.using(rounds=base)
+        seconds = _best_time(lambda: handler.hash("calibrate"), samples)
+        cost = math.floor(base + math.log2(target / seconds))
+        cost = min(max(cost, MIN_BCRYPT_ROUNDS), MAX_BCRYPT_ROUNDS)
+        estimate = seconds * 2 ** (cost - base)
+        settings.password_bcrypt_rounds = cost
+        description = f"bcrypt rounds={cost}"
+    else:
+        from passlib.hash import argon2
+
+        handler = argon2.using(
+            memory_cost=settings.password_argon2_memory_kib,
+            parallelism=settings.password_argon2_parallelism,
+            rounds=1,
+        )
+        seconds = _best_time(lambda: handler.hash("calibrate"), samples)
+        cost = min(
+            max(math.floor(target / seconds), MIN_ARGON2_TIME_COST),
+            MAX_ARGON2_TIME_COST,
+        )
+        estimate = seconds * cost
+        settings.password_argon2_time_cost = cost
+        description = (
+            f"argon2 time_cost={cost} "
+            f"memory_kib={settings.password_argon2_memory_kib} "
+            f"parallelism={settings.password_argon2_parallelism}"
+        )
+
+    get_pwd_context.cache_clear()
+    logger.info(
+        f"PASSWORD HASH CALIBRATED: {description}, ~{estimate * 1000:.0f}ms per verify"
+    )
+    return cost
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when the password hashing queue is full and the job was not accepted.
+    """
+
+
+# module level so they can be pickled and sent to a worker process
+def _hash_password(raw_password: str) -> str:
+    return get_pwd_context().hash(raw_password)
+
+
+def _verify_password(raw_password: str, password_hash: str) -> bool:
+    return get_pwd_context().verify(raw_password, password_hash)
+
+
+def _verify_and_update_password(
+    raw_password: str, password_hash: str
+) -> Tuple[bool, Union[str, None]]:
+    # a new hash is only returned when the password matched and needs_update() said so
+    return get_pwd_context().verify_and_update(raw_password, password_hash)
+
+
+def _warm_up() -> None:
+    # a full hash, quick jobs would let one process take several of them
+    get_pwd_context().hash("warm-up")
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a bounded pool.
+
+    At most `max_concurrency` jobs run at once and at most `max_queue` jobs may
+    wait for a slot, anything beyond that raises PasswordHasherBusy right away
+    instead of piling up behind a login burst.
+    """
+
+    def __init__(
+        self,
+        executor_type: str = "process",
+        workers: int = 1,
+        max_concurrency: int = 1,
+        max_queue: int = 64,
+    ):
+        if executor_type not in ("process", "thread"):
+            raise RuntimeError(
+                f"UNSUPPORTED PASSWORD_HASH_EXECUTOR {executor_type!r}, "
+                "EXPECTED 'process' OR 'thread'"
+            )
+        self.executor_type = executor_type
+        self.workers = max(workers, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+
+        self._executor: Union[Executor, None] = None
+        # created on first use so it binds to the running loop
+        self._semaphore: Union[asyncio.Semaphore, None] = None
+        self._waiting = 0
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.executor_type == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_apply_hash_settings,
+                initargs=({name: getattr(settings, name) for name in HASH_SETTINGS},),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-hasher"
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._semaphore = None
+
+    async def warm_up(self) -> None:
+        """
+        Starts every pool worker and loads the bcrypt backend in it.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _warm_up)
+                for _ in range(self.workers)
+            )
+        )
+
+    async def _run(self, operation: str, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            self.start()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            password_hash_rejected_total.inc()
+            raise PasswordHasherBusy("password hashing queue is full")
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        started = time.perf_counter()
+        password_hash_queue_wait_seconds.observe(started - queued_at)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._semaphore.release()
+            password_hash_duration_seconds.observe(
+                time.perf_counter() - started, operation
+            )
+
+    async def hash(self, raw_password: str) -> str:
+        return await self._run("hash", _hash_password, raw_password)
+
+    async def verify(self, raw_password: str, password_hash: str) -> bool:
+        return await self._run("verify", _verify_password, raw_password, password_hash)
+
+    async def verify_and_update(
+        self, raw_password: str, password_hash: str
+    ) -> Tuple[bool, Union[str, None]]:
+        """
+        Verifies, and rehashes in the same job when the hash is outdated.
+        Returns (verified, new hash or None).
+        """
+        return await self._run(
+            "verify", _verify_and_update_password, raw_password, password_hash
+        )
+
+
+password_hasher = PasswordHasher(
+    executor_type=settings.password_hash_executor,
+    workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_concurrency,
+    max_queue=settings.password_hash_max_queue,
+)
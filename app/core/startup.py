@@ -0,0 +1,40 @@
+"""
+Startup phase timings, logged once the app is ready to serve and exported
+as the app_startup_phase_seconds gauge.
+"""
+
+from time import perf_counter
+from typing import Dict, Union
+import logging
+import os
+
+from app.core.metrics import app_startup_phase_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self, started: Union[float, None] = None):
+        self._last = perf_counter() if started is None else started
+        # phase -> seconds, in the order they ran
+        self.phases: Dict[str, float] = {}
+        # workers forked from a preloaded parent time their phases from the fork
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._last = perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """
+        Ends `phase`, timed from the previous mark.
+        """
+        now = perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def report(self) -> None:
+        for phase, seconds in self.phases.items():
+            app_startup_phase_seconds.set_function(lambda s=seconds: s, phase)
+        breakdown = ", ".join(f"{p}={s * 1000:.1f}ms" for p, s in self.phases.items())
+        total = sum(self.phases.values())
+        logger.info(f"STARTUP TOOK {total * 1000:.1f}ms ({breakdown})")
@@ -0,0 +1,247 @@
+"""
+WebSocket connections of one worker, indexed by user.
+
+Every connection gets a bounded send queue drained by its own writer task,
+so a broadcast only serializes the message once and puts the same frame in
+every queue without awaiting anyone. A client that doesn't read fast enough
+fills its queue and is disconnected instead of buffering without limit or
+holding up the others.
+
+One heartbeat sweep serves all connections: it sends a ping frame, drops
+connections that stayed silent for WS_IDLE_TIMEOUT and closes the ones whose
+access token expired or was revoked since they connected.
+
+Like the rate limits and revocation map, the index lives in each worker's
+memory; sending to a user reaches their connections on this worker only.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, Set, Union
+from uuid import UUID
+import asyncio
+import time
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.jwt import TokenPayload
+from app.core.metrics import (
+    websocket_connections,
+    websocket_evictions_total,
+    websocket_frames_sent_total,
+)
+from app.core.responses import dumps
+from app.core.revocation import revocations
+
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# how long a close handshake may take before the connection is abandoned
+CLOSE_TIMEOUT = 5
+
+
+def encode_frame(message: Any) -> str:
+    return dumps(message).decode()
+
+
+PING_FRAME = encode_frame({"type": "ping"})
+PONG_FRAME = encode_frame({"type": "pong"})
+
+
+class Connection:
+    __slots__ = (
+        "websocket",
+        "user_id",
+        "token",
+        "payload",
+        "queue_size",
+        "last_seen",
+        "closing",
+        "_frames",
+        "_wakeup",
+        "_writer",
+    )
+
+    def __init__(
+        self, websocket: WebSocket, token: str, payload: TokenPayload, queue_size: int
+    ):
+        self.websocket = websocket
+        self.user_id: UUID = payload.identity
+        self.token = token
+        self.payload = payload
+        self.queue_size = queue_size
+        self.last_seen = time.monotonic()
+        self.closing = False
+        # a deque and one future instead of asyncio.Queue: half the cost per
+        # put and a fraction of the memory, which adds up over every connection
+        self._frames: Deque[str] = deque()
+        self._wakeup: Union[asyncio.Future, None] = None
+        self._writer: Union[asyncio.Task, None] = None
+
+    def pending(self) -> int:
+        return len(self._frames)
+
+    def send(self, frame: str) -> bool:
+        """
+        Queues an encoded frame, returns False when the queue is full.
+        """
+        if len(self._frames) >= self.queue_size:
+            return False
+        self._frames.append(frame)
+        wakeup = self._wakeup
+        if wakeup is not None:
+            self._wakeup = None
+            if not wakeup.done():
+                wakeup.set_result(None)
+        return True
+
+    async def _write(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not self._frames:
+                    self._wakeup = loop.create_future()
+                    await self._wakeup
+                    continue
+                await self.websocket.send_text(self._frames.popleft())
+                websocket_frames_sent_total.inc()
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            # the reader notices the disconnect and cleans up
+            return
+
+    async def run(self) -> None:
+        """
+        Reads from the client until it disconnects, the writer runs alongside.
+        """
+        self._writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                self.last_seen = time.monotonic()
+                # anything counts as a sign of life, only pings need an answer
+                if message.get("text") == PING_FRAME:
+                    self.send(PONG_FRAME)
+        except (WebSocketDisconnect, RuntimeError):
+            return
+        finally:
+            self._writer.cancel()
+
+    def close(self, code: int, reason: str = "") -> None:
+        """
+        Stops writing and closes in the background, the reader sees the disconnect.
+        """
+        if self.closing:
+            return
+        self.closing = True
+        if self._writer is not None:
+            self._writer.cancel()
+        asyncio.get_running_loop().create_task(self._close(code, reason))
+
+    async def _close(self, code: int, reason: str) -> None:
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=code, reason=reason), CLOSE_TIMEOUT
+            )
+        except Exception:
+            # already gone, or too slow to even take the close frame
+            pass
+
+
+class ConnectionManager:
+    def __init__(self, queue_size: int = 64, max_connections: int = 0):
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self._by_user: Dict[UUID, Set[Connection]] = {}
+        self._count = 0
+        websocket_connections.set_function(lambda: self._count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def is_full(self) -> bool:
+        return 0 < self.max_connections <= self._count
+
+    def add(
+        self, websocket: WebSocket, token: str, payload: TokenPayload
+    ) -> Connection:
+        connection = Connection(websocket, token, payload, self.queue_size)
+        self._by_user.setdefault(connection.user_id, set()).add(connection)
+        self._count += 1
+        return connection
+
+    def remove(self, connection: Connection) -> None:
+        connections = self._by_user.get(connection.user_id)
+        if not connections or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._by_user[connection.user_id]
+        self._count -= 1
+
+    def evict(self, connection: Connection, code: int, reason: str) -> None:
+        if not connection.closing:
+            websocket_evictions_total.inc(reason)
+        connection.close(code, reason)
+
+    def _fan_out(self, connections, frame: str) -> int:
+        sent = 0
+        for connection in connections:
+            if connection.closing:
+                continue
+            if connection.send(frame):
+                sent += 1
+            else:
+                self.evict(connection, CLOSE_TRY_AGAIN_LATER, "slow consumer")
+        return sent
+
+    def send_to_user(self, user_id: UUID, message: Any) -> int:
+        """
+        Sends a message to every connection of a user, returns how many got it.
+        """
+        connections = self._by_user.get(user_id)
+        if not connections:
+            return 0
+        return self._fan_out(connections, encode_frame(message))
+
+    def broadcast(self, message: Any) -> int:
+        """
+        Sends a message to every connection, encoded once for all of them.
+        """
+        # nothing here awaits, so the index can't change while it is walked
+        frame = encode_frame(message)
+        return sum(
+            self._fan_out(connections, frame) for connections in self._by_user.values()
+        )
+
+    def close_user(self, user_id: UUID, code: int = CLOSE_POLICY_VIOLATION) -> None:
+        for connection in tuple(self._by_user.get(user_id, ())):
+            self.evict(connection, code, "closed")
+
+    def heartbeat(self, idle_timeout: float) -> None:
+        """
+        Pings every connection, closing idle ones and ones whose token is no longer valid.
+        """
+        now = time.monotonic()
+        wall_now = time.time()
+        for connections in self._by_user.values():
+            for connection in connections:
+                if connection.closing:
+                    continue
+                payload = connection.payload
+                if payload.exp < wall_now or revocations.is_revoked(
+                    payload, connection.token
+                ):
+                    self.evict(connection, CLOSE_POLICY_VIOLATION, "token invalid")
+                elif idle_timeout > 0 and now - connection.last_seen > idle_timeout:
+                    self.evict(connection, CLOSE_GOING_AWAY, "idle")
+                elif not connection.send(PING_FRAME):
+                    self.evict(connection, CLOSE_TRY_AGAIN_LATER, "slow consumer")
+
+
+ws_manager = ConnectionManager(
+    queue_size=settings.ws_send_queue_size,
+    max_connections=settings.ws_max_connections,
+)
@@ -0,0 +1,25 @@
+"""
+Writes this worker's metric samples to the shared METRICS_DIR, so /metrics on
+any worker can serve them (see app.core.metrics).
+"""
+
+import asyncio
+import logging
+
+from app.core.metrics import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+async def run_metrics_snapshots(directory: str, interval: float) -> None:
+    """
+    Runs write_snapshot every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            write_snapshot(directory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ERR WRITING METRICS SNAPSHOT: {e}")
+        await asyncio.sleep(interval)
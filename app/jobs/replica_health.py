@@ -0,0 +1,25 @@
+"""
+Probes the read replicas in the background so unreachable or lagging ones are
+taken out of rotation before requests hit them, and put back once they recover.
+"""
+
+import asyncio
+import logging
+
+from app.core.db import get_replicas
+
+logger = logging.getLogger(__name__)
+
+
+async def run_replica_health_checks(interval: float, max_lag: float) -> None:
+    """
+    Runs ReplicaSet.check every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            await get_replicas().check(max_lag=max_lag)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ERR CHECKING READ REPLICAS: {e}")
+        await asyncio.sleep(interval)
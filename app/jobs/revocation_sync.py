@@ -0,0 +1,56 @@
+"""
+Keeps each worker's in-memory revocation map in sync with the token_revocation
+table, so a logout or password change on one worker is enforced by all of them
+within REVOCATION_SYNC_INTERVAL seconds.
+
+Every row also drops the user's cached principal, profile and password
+changes write a row that revokes nothing just for that.
+"""
+
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+
+from app.core.db import async_session_maker
+from app.core.principal import invalidate_principal
+from app.core.revocation import revocations
+from app.repositories.revocation_repo import get_revocations_since
+
+logger = logging.getLogger(__name__)
+
+# rows are stamped by the database at insert but become visible at commit,
+# re-reading a short window catches ones that committed out of order
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+async def sync_revocations() -> int:
+    """
+    Applies revocations created since the last sync. Returns the number of rows read.
+    """
+    since = revocations.last_seen
+    if since is not None:
+        since -= SYNC_OVERLAP
+
+    async with async_session_maker() as session:
+        rows = await get_revocations_since(
+            session=session, since=since, now=datetime.now(timezone.utc)
+        )
+    for row in rows:
+        revocations.apply(row)
+        invalidate_principal(row.user_id)
+    revocations.prune()
+    return len(rows)
+
+
+async def run_revocation_sync(interval: float) -> None:
+    """
+    Runs sync_revocations every `interval` seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_revocations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ERR SYNCING TOKEN REVOCATIONS: {e}")
@@ -0,0 +1,121 @@
+"""
+Purges expired and deactivated rows from the token table in small batches.
+
+Every batch is its own transaction, so the job can be stopped at any point
+and simply started again later. It runs either as a CLI:
+
+    python -m app.jobs.token_retention [--batch-size 1000] [--pause 0.05]
+
+or as a background task started by the app lifespan when
+TOKEN_RETENTION_INTERVAL is set.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Union
+import argparse
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.core.db import async_session_maker
+from app.core.jwt import TOKEN_LIFETIME_SECONDS
+from app.repositories.token_repo import purge_tokens_batch
+from app.repositories.revocation_repo import purge_expired_revocations
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_tokens(
+    batch_size: int = settings.token_retention_batch_size,
+    pause: float = settings.token_retention_batch_pause,
+    inactive_grace: float = settings.token_retention_inactive_grace,
+    max_batches: Union[int, None] = None,
+) -> int:
+    """
+    Deletes tokens batch by batch until nothing is left to purge.
+    Returns the total number of rows deleted.
+    """
+    now = datetime.now(timezone.utc)
+    expired_before = now - timedelta(seconds=TOKEN_LIFETIME_SECONDS["refresh"])
+    inactive_before = now - timedelta(seconds=inactive_grace)
+
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        async with async_session_maker() as session:
+            deleted = await purge_tokens_batch(
+                session=session,
+                expired_before=expired_before,
+                inactive_before=inactive_before,
+                batch_size=batch_size,
+            )
+        total += deleted
+        batches += 1
+        if deleted < batch_size:
+            break
+        # throttle so the purge never competes with request traffic for long
+        await asyncio.sleep(pause)
+
+    # revocations are only needed until the access tokens they cover expire
+    async with async_session_maker() as session:
+        await purge_expired_revocations(session=session, now=now)
+
+    logger.info(f"TOKEN RETENTION PURGED {total} ROWS IN {batches} BATCHES")
+    return total
+
+
+async def run_token_retention(interval: float) -> None:
+    """
+    Runs purge_tokens every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            await purge_tokens()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ERR RUNNING TOKEN RETENTION: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Purge expired and deactivated tokens."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.token_retention_batch_size
+    )
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=settings.token_retention_batch_pause,
+        help="seconds to sleep between batches",
+    )
+    parser.add_argument(
+        "--inactive-grace",
+        type=float,
+        default=settings.token_retention_inactive_grace,
+        help="seconds to keep deactivated tokens before purging them",
+    )
+    parser.add_argument(
+        "--max-batches",
+        type=int,
+        default=None,
+        help="stop after this many batches, run again later to resume",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(
+        purge_tokens(
+            batch_size=args.batch_size,
+            pause=args.pause,
+            inactive_grace=args.inactive_grace,
+            max_batches=args.max_batches,
+        )
+    )
+    print(f"purged {total} tokens")
+
+
+if __name__ == "__main__":
+    main()
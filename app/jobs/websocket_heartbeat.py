@@ -0,0 +1,23 @@
+"""
+Heartbeat for the websocket gateway, one sweep over all of this worker's
+connections instead of a timer per connection.
+"""
+
+import asyncio
+import logging
+
+from app.core.websocket import ws_manager
+
+logger = logging.getLogger(__name__)
+
+
+async def run_websocket_heartbeat(interval: float, idle_timeout: float) -> None:
+    """
+    Runs ConnectionManager.heartbeat every `interval` seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            ws_manager.heartbeat(idle_timeout)
+        except Exception as e:
+            logger.error(f"ERR IN WEBSOCKET HEARTBEAT: {e}")
@@ -1,31 +1,129 @@
-from dotenv import load_dotenv, find_dotenv
+from time import perf_counter
 import logging
 
+# taken before anything heavy is imported so the startup report covers imports
+_imports_started = perf_counter()
+
 # initializing the logger
 logger = logging.getLogger(__name__)
 
-# loading the envs from file
-load_dotenv(find_dotenv(filename=".env", raise_error_if_not_found=True))
-
-# load rest of dependencies from now
-from fastapi import FastAPI, Depends, status
-from fastapi.responses import RedirectResponse, JSONResponse
+# settings read .env themselves (see app.core.config)
+from fastapi import FastAPI, Depends, Request, status
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from typing import Annotated
 from contextlib import asynccontextmanager
+import asyncio
 
 # local imports
 from app.core.config import settings
-from app.core.db import Session, get_session, create_db_and_tables
+from app.core.responses import JSONResponse
+from app.core.db import (
+    AsyncSession,
+    get_async_session,
+    create_db_and_tables_async,
+    dispose_engines,
+    warm_up_pool,
+)
+from app.core.security import (
+    password_hasher,
+    PasswordHasherBusy,
+    calibrate_password_hash,
+    check_password_hash_backend,
+)
+from app.core.rate_limit import RateLimitExceeded
+from app.core.jwt import init_jwt_codec
+from app.jobs.token_retention import run_token_retention
+from app.jobs.revocation_sync import sync_revocations, run_revocation_sync
+from app.jobs.replica_health import run_replica_health_checks
+from app.jobs.websocket_heartbeat import run_websocket_heartbeat
+from app.jobs.metrics_snapshot import run_metrics_snapshots
+from app.core.metrics import registry, read_snapshots, remove_snapshot
+from app.core.startup import StartupTimer
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.query_accounting import QueryAccountingMiddleware
+from app.middleware.read_your_writes import ReadYourWritesMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-import os
+
+
+startup_timer = StartupTimer(started=_imports_started)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    # production relies on alembic for the schema, create_all is a round trip
+    # per table and runs in every worker
+    if settings.db_create_all:
+        await create_db_and_tables_async()
+        startup_timer.mark("create_all")
+    init_jwt_codec()
+    check_password_hash_backend()
+    # the launcher calibrates once before forking, this covers plain uvicorn
+    if settings.password_hash_target_ms > 0:
+        calibrate_password_hash(settings.password_hash_target_ms)
+    password_hasher.start()
+    startup_timer.mark("init")
+
+    try:
+        await sync_revocations()
+    except Exception as e:
+        logger.error(f"ERR LOADING TOKEN REVOCATIONS: {e}")
+    startup_timer.mark("revocations")
+
+    # per worker: the launcher forks before the lifespan runs
+    if settings.db_pool_warmup > 0:
+        try:
+            await warm_up_pool(settings.db_pool_warmup)
+        except Exception as e:
+            logger.error(f"ERR WARMING UP DB POOL: {e}")
+    if settings.password_hash_warmup:
+        await password_hasher.warm_up()
+    startup_timer.mark("warmup")
+
+    background_tasks = []
+    if settings.revocation_sync_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(run_revocation_sync(settings.revocation_sync_interval))
+        )
+    if settings.postgres_replica_hosts and settings.db_replica_health_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                run_replica_health_checks(
+                    settings.db_replica_health_interval, settings.db_replica_max_lag
+                )
+            )
+        )
+    if settings.token_retention_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(run_token_retention(settings.token_retention_interval))
+        )
+    if settings.ws_heartbeat_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                run_websocket_heartbeat(
+                    settings.ws_heartbeat_interval, settings.ws_idle_timeout
+                )
+            )
+        )
+    metrics_dir = settings.metrics_enabled and settings.metrics_dir
+    if metrics_dir and settings.metrics_snapshot_interval > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                run_metrics_snapshots(metrics_dir, settings.metrics_snapshot_interval)
+            )
+        )
+    startup_timer.report()
+
     yield
 
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if metrics_dir:
+        remove_snapshot(metrics_dir)
+    password_hasher.shutdown()
+    await dispose_engines()
+
 
 # initializing the app
 app = FastAPI(
@@ -33,13 +131,47 @@ app = FastAPI(
     redirect_slashes=settings.redirect_slashes,
     title=settings.app_title,
     description=settings.app_description,
+    default_response_class=JSONResponse,
     lifespan=lifespan,
 )
-if os.getenv("ENVIROMENT", "development") == "production":
+if settings.enviroment == "production":
     app.add_middleware(HTTPSRedirectMiddleware)
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=[])
+if settings.postgres_replica_hosts:
+    app.add_middleware(
+        ReadYourWritesMiddleware, pin_seconds=settings.db_replica_pin_seconds
+    )
+app.add_middleware(
+    QueryAccountingMiddleware,
+    statement_budget=settings.sql_statement_budget,
+    repeat_threshold=settings.sql_repeat_threshold,
+    server_timing=settings.sql_server_timing,
+    log_all=settings.sql_log_requests,
+)
+if settings.metrics_enabled:
+    # added last so it wraps everything and times the full request
+    app.add_middleware(MetricsMiddleware)
+
 
-SessionDep = Annotated[Session, Depends(get_session)]
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        {"message": "We're handling too many requests right now, Please try again!"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        {"message": "Too many attempts, Please try again later!"},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 
 @app.get("/", include_in_schema=False)
@@ -52,13 +184,36 @@ async def ping():
     return JSONResponse({"message": "pong!"}, status_code=status.HTTP_200_OK)
 
 
-from app.routers import authRouter, userRouter
+if settings.metrics_enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        # a scrape reaches one worker, the others answer through their snapshots
+        others = read_snapshots(settings.metrics_dir) if settings.metrics_dir else ()
+        return PlainTextResponse(
+            registry.render(others), media_type="text/plain; version=0.0.4"
+        )
+
+
+from app.routers import (
+    authRouter,
+    userRouter,
+    wsRouter,
+    adminRouter,
+    wellKnownRouter,
+)
 
 app.include_router(router=authRouter)
 app.include_router(router=userRouter)
+app.include_router(router=wsRouter)
+app.include_router(router=adminRouter)
+app.include_router(router=wellKnownRouter)
+
+startup_timer.mark("imports")
 
 
 if __name__ == "__main__":
+    # development server, production runs `python -m app` (see app/server.py)
     import uvicorn
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1 +1 @@
-from .authenticator import authenticator
+from .authenticator import authenticator, require_admin
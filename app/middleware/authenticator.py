@@ -3,14 +3,17 @@ from datetime import datetime
 from logging import Logger
 
 # local imports
-from app.repositories.user_repo import get_user_by_id
+from app.repositories.user_repo import get_principal_by_id, is_user_admin
 from app.core.jwt import decode_token
-from app.core.db import Session, get_session
+from app.core.revocation import revocations
+from app.core.db import AsyncSession, get_async_session, get_async_read_session
 
 logger = Logger(__name__)
 
 
-def authenticator(request: Request, session: Session = Depends(get_session)):
+async def authenticator(
+    request: Request, session: AsyncSession = Depends(get_async_read_session)
+):
     try:
         access = request.cookies.get("access", "")
         if not access:
@@ -21,12 +24,29 @@ def authenticator(request: Request, session: Session = Depends(get_session)):
             datetime.now().timestamp()
         ):
             raise HTTPException(status_code=401, detail="Unauthorized")
+        # refresh tokens carry the same identity, they must not open the API
+        if access_token_payload.type != "access":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        if revocations.is_revoked(access_token_payload, access):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
         user_id = access_token_payload.identity
-        user = get_user_by_id(session=session, user_id=user_id)
-        if not user or not user.is_active:
+        principal = await get_principal_by_id(session=session, user_id=user_id)
+        if not principal or not principal.is_active:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
-        request.state.user = user
+        request.state.user = principal
     except Exception as e:
         logger.error(f"ERR AT AUTHENTICATOR MIDDLEWARE: {e}")
         raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+async def require_admin(
+    request: Request, session: AsyncSession = Depends(get_async_session)
+):
+    # runs after authenticator, which sets request.state.user; the flag is read
+    # from the primary, a cached principal would keep a demoted admin in for
+    # up to PRINCIPAL_CACHE_TTL on every worker
+    principal = getattr(request.state, "user", None)
+    if not principal or not await is_user_admin(session=session, user_id=principal.id):
+        raise HTTPException(status_code=403, detail="Forbidden")
@@ -0,0 +1,41 @@
+from time import perf_counter
+
+from app.core.metrics import http_requests_total, http_request_duration_seconds
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count and latency per route template.
+
+    Requests that match no route are grouped under "unmatched" so arbitrary
+    paths can't blow up the number of series.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_request_duration_seconds.observe(
+                perf_counter() - started, method, path
+            )
+            http_requests_total.inc(method, path, str(status_code))
@@ -0,0 +1,81 @@
+import json
+import logging
+
+from app.core.query_accounting import QueryStats, current_query_stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryAccountingMiddleware:
+    """
+    Pure ASGI middleware attributing SQL statements to the request.
+
+    Adds a `Server-Timing: db;dur=<ms>;desc="<n> queries"` header and logs a
+    JSON line per request, at WARNING when the request went over the
+    statement budget or repeated one statement `repeat_threshold` times
+    (a likely N+1), otherwise at INFO when `log_all` is set.
+    """
+
+    def __init__(
+        self,
+        app,
+        statement_budget: int = 10,
+        repeat_threshold: int = 5,
+        server_timing: bool = True,
+        log_all: bool = False,
+    ):
+        self.app = app
+        self.statement_budget = statement_budget
+        self.repeat_threshold = repeat_threshold
+        self.server_timing = server_timing
+        self.log_all = log_all
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        reset_token = current_query_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing and stats.count:
+                    header = f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_stats.reset(reset_token)
+            self._report(scope, status_code, stats)
+
+    def _report(self, scope, status_code: int, stats: QueryStats) -> None:
+        over_budget = 0 < self.statement_budget < stats.count
+        statement, repeats = stats.most_repeated()
+        repeated = 0 < self.repeat_threshold <= repeats
+        if not (over_budget or repeated or self.log_all):
+            return
+
+        route = scope.get("route")
+        record = {
+            "event": "request_sql",
+            "method": scope["method"],
+            "route": getattr(route, "path", scope["path"]),
+            "status": status_code,
+            "queries": stats.count,
+            "db_ms": round(stats.duration * 1000, 3),
+            "over_budget": over_budget,
+        }
+        if repeated:
+            record["repeated_statement"] = statement
+            record["repeated_count"] = repeats
+
+        level = logging.WARNING if over_budget or repeated else logging.INFO
+        logger.log(level, json.dumps(record))
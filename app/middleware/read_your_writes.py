@@ -0,0 +1,52 @@
+import math
+
+from starlette.requests import cookie_parser
+
+from app.core.replicas import RequestPin, current_request_pin
+
+PIN_COOKIE = "db_pin"
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI middleware carrying the replica read pin with the client.
+
+    A request that wrote (see app.core.replicas.pin_to_primary) answers with a
+    `db_pin` cookie living `pin_seconds`; while the client sends it back, its
+    requests read from the primary whichever worker serves them. The cookie
+    only ever moves reads to the primary, so a forged one costs nothing but
+    replica offload.
+    """
+
+    def __init__(self, app, pin_seconds: float = 5):
+        self.app = app
+        self.max_age = max(math.ceil(pin_seconds), 1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        pinned = False
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                pinned = PIN_COOKIE in cookie_parser(value.decode("latin-1"))
+                break
+        pin = RequestPin(pinned=pinned)
+        reset_token = current_request_pin.set(pin)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and pin.wrote:
+                cookie = (
+                    f"{PIN_COOKIE}=1; Max-Age={self.max_age}; Path=/; "
+                    "HttpOnly; Secure; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_pin.reset(reset_token)
@@ -1,2 +1,3 @@
 from .user import User
 from .token import Token
+from .token_revocation import TokenRevocation
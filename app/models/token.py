@@ -1,16 +1,44 @@
 from sqlmodel import Field, SQLModel
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Index, func
 from datetime import datetime
 from typing import Optional
 import uuid
 
+# longer user agents are cut, the value is also stored in the sessions index
+USER_AGENT_MAX_LENGTH = 512
+
 
 class Token(SQLModel, table=True):
     __tablename__ = "token"
+    __table_args__ = (
+        # newest-first session listing per user (keyset on created_at, id),
+        # covering so a page is read from the index alone
+        Index(
+            "ix_token_user_id_is_active_created_at",
+            "user_id",
+            "is_active",
+            "created_at",
+            "id",
+            postgresql_include=[
+                "user_agent",
+                "ip_address",
+                "access_token_hash",
+            ],
+        ),
+        # retention purge: both of its conditions are ranges on updated_at
+        Index("ix_token_updated_at", "updated_at"),
+    )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, unique=True)
     user_id: uuid.UUID = Field(foreign_key="user.id")
-    refresh_token: str = Field()
-    access_token: str = Field()
+    # sha256 hex digests (app.core.jwt.token_digest), raw JWTs are never stored
+    refresh_token_hash: str = Field(max_length=64, unique=True, index=True)
+    access_token_hash: str = Field(max_length=64)
+    # jti claim of the access token, what a revocation of it is keyed on
+    access_token_jti: Optional[str] = Field(default=None, max_length=32)
+    # the refresh token this row was rotated from, presenting it again is a reuse
+    previous_refresh_token_hash: Optional[str] = Field(
+        default=None, max_length=64, index=True
+    )
     is_active: bool = Field(default=False)
     user_agent: Optional[str] = Field(default="")
     ip_address: Optional[str] = Field(default="", max_length=45)
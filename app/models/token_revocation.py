@@ -0,0 +1,37 @@
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime, func
+from datetime import datetime
+from typing import Optional
+import uuid
+
+
+class TokenRevocation(SQLModel, table=True):
+    """
+    Append-only log of access token revocations, polled by every worker to
+    keep its in-memory revocation map and principal cache in sync.
+    """
+
+    __tablename__ = "token_revocation"
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, unique=True)
+    user_id: uuid.UUID = Field(foreign_key="user.id")
+    # every access token of user_id with a lower "ver" claim is revoked
+    min_token_version: Optional[int] = Field(default=None)
+    # or a single access token (logout), by jti; rows written before jtis were
+    # stored only have the token's digest; a row with none of these only
+    # announces that user_id changed
+    access_token_jti: Optional[str] = Field(default=None, max_length=32)
+    access_token_hash: Optional[str] = Field(default=None, max_length=64)
+
+    created_at: datetime = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True),
+            server_default=func.now(),
+            nullable=False,
+            index=True,
+        ),
+    )
+    # past this point every token the entry covers has expired on its own
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
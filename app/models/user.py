@@ -1,15 +1,35 @@
 from sqlmodel import Field, SQLModel
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import DDL, Column, DateTime, Index, event, func, text
 from datetime import datetime
 from pydantic import EmailStr, field_validator
-from passlib.context import CryptContext
+from typing import Tuple, Union
 import uuid, re
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.security import get_pwd_context, password_hasher
+
+
+# what the admin search matches against, every field prefixed by a space so
+# "% term%" is a prefix match on any of them. Identifiers are stored without
+# whitespace, so a (normalized) term never spans two fields. Must stay
+# identical to the ix_user_search_trgm expression (here and in the alembic
+# revision) for the trigram index to be used.
+SEARCH_DOCUMENT_SQL = (
+    "(' ' || first_name || ' ' || last_name || ' ' || username || ' ' || email)"
+)
 
 
 class User(SQLModel, table=True):
     __tablename__ = "user"
+    __table_args__ = (
+        # newest-first keyset pagination of the admin user listing
+        Index("ix_user_created_at_id", "created_at", "id"),
+        # substring search over SEARCH_DOCUMENT_SQL, postgres only (pg_trgm)
+        Index(
+            "ix_user_search_trgm",
+            text(f"{SEARCH_DOCUMENT_SQL} gin_trgm_ops"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, unique=True)
     first_name: str = Field(max_length=25, index=True)
@@ -19,6 +39,9 @@ class User(SQLModel, table=True):
     password_hash: str
     is_active: bool = Field(default=False)
     is_email_verified: bool = Field(default=False)
+    is_admin: bool = Field(default=False, sa_column_kwargs={"server_default": "false"})
+    # embedded in issued tokens as "ver", bumped to revoke every token at once
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     last_profile_updated_at: datetime = Field(
         sa_column=Column(
@@ -60,10 +83,34 @@ class User(SQLModel, table=True):
         return v.lower()
 
     def set_password(self, raw_password: str):
-        self.password_hash = pwd_context.hash(raw_password)
+        self.password_hash = get_pwd_context().hash(raw_password)
 
     def verify_password(self, raw_password: str) -> bool:
-        return pwd_context.verify(raw_password, self.password_hash)
+        return get_pwd_context().verify(raw_password, self.password_hash)
+
+    # awaitable variants, bcrypt runs on the password hasher pool
+    async def set_password_async(self, raw_password: str):
+        self.password_hash = await password_hasher.hash(raw_password)
+
+    async def verify_password_async(self, raw_password: str) -> bool:
+        return await password_hasher.verify(raw_password, self.password_hash)
+
+    async def verify_and_update_password_async(
+        self, raw_password: str
+    ) -> Tuple[bool, Union[str, None]]:
+        """
+        Like verify_password_async, also returns the rehashed password when
+        the stored hash uses an outdated scheme or cost (None otherwise).
+        """
+        return await password_hasher.verify_and_update(raw_password, self.password_hash)
 
     def get_full_name(self) -> str:
         return f"{self.first_name} {self.last_name}"
+
+
+# create_all builds ix_user_search_trgm too, the extension has to exist first
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
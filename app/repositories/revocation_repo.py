@@ -0,0 +1,42 @@
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Union
+from datetime import datetime
+import logging
+
+from app.models import TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+
+async def get_revocations_since(
+    session: AsyncSession, since: Union[datetime, None], now: datetime
+) -> List[TokenRevocation]:
+    """
+    Retrieves the revocations that are still in effect, created after `since` when given.
+    """
+    try:
+        statement = select(TokenRevocation).where(TokenRevocation.expires_at > now)
+        if since is not None:
+            statement = statement.where(TokenRevocation.created_at > since)
+        statement = statement.order_by(TokenRevocation.created_at)
+
+        return list((await session.exec(statement)).all())
+    except Exception as e:
+        logger.error(f"ERR GETTING TOKEN REVOCATIONS: {e}")
+        return []
+
+
+async def purge_expired_revocations(session: AsyncSession, now: datetime) -> int:
+    """
+    Returns the number of rows deleted.
+    """
+    stmt = delete(TokenRevocation).where(TokenRevocation.expires_at <= now)
+    try:
+        result = await session.exec(stmt)
+        await session.commit()
+        return max(result.rowcount or 0, 0)
+    except Exception as e:
+        await session.rollback()
+        logger.exception("ERR PURGING TOKEN REVOCATIONS: %s", e)
+        return 0
@@ -1,28 +1,46 @@
-from sqlmodel import Session, select, update
-from typing import Union
+from sqlmodel import select, update, delete, or_, and_, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Union
 from uuid import UUID
+from datetime import datetime, timedelta, timezone
 import logging
 
 
-from app.models import Token
+from app.models import Token, TokenRevocation, User
+from app.models.token import USER_AGENT_MAX_LENGTH
+from app.core.principal import invalidate_principal
+from app.core.replicas import pin_to_primary
+from app.core.jwt import token_digest, token_jti, TOKEN_LIFETIME_SECONDS
+from app.core.revocation import revocations
 from app.schemas.token import TokenCreationSchema
 
 
 logger = logging.getLogger(__name__)
 
 
-def get_token_by_refresh_token(
-    session: Session, refresh_token: str
+def _access_token_horizon() -> datetime:
+    """
+    Point after which every access token issued until now has expired.
+    """
+    return datetime.now(timezone.utc) + timedelta(
+        seconds=TOKEN_LIFETIME_SECONDS["access"]
+    )
+
+
+async def get_token_by_refresh_token(
+    session: AsyncSession, refresh_token: str
 ) -> Union[Token, None]:
     """
     Retrieves a single token instance from the database based on refresh_token.
     """
     # Create a select statement to find the token with the refresh_token
     try:
-        statement = select(Token).where(Token.refresh_token == refresh_token)
+        statement = select(Token).where(
+            Token.refresh_token_hash == token_digest(refresh_token)
+        )
 
         # Execute the statement and get the first result
-        token_instance = session.exec(statement).first()
+        token_instance = (await session.exec(statement)).first()
 
         return token_instance
     except Exception as e:
@@ -30,8 +48,8 @@ def get_token_by_refresh_token(
         return None
 
 
-def create_token(
-    session: Session, token_data: TokenCreationSchema
+async def create_token(
+    session: AsyncSession, token_data: TokenCreationSchema
 ) -> Union[Token, None]:
     """
     Retrieves a single token instance from the database based on refresh_token.
@@ -40,16 +58,17 @@ def create_token(
     try:
         token = Token(
             user_id=token_data.user_id,
-            access_token=token_data.access_token,
-            refresh_token=token_data.refresh_token,
+            access_token_hash=token_digest(token_data.access_token),
+            access_token_jti=token_jti(token_data.access_token),
+            refresh_token_hash=token_digest(token_data.refresh_token),
             ip_address=token_data.ip_address,
-            user_agent=token_data.user_agent,
+            user_agent=(token_data.user_agent or "")[:USER_AGENT_MAX_LENGTH],
             is_active=True,
         )
 
         session.add(token)
-        session.commit()
-        session.refresh(token)
+        await session.commit()
+        await session.refresh(token)
 
         return token
     except Exception as e:
@@ -57,41 +76,216 @@ def create_token(
         return None
 
 
-def update_access_token(
-    session: Session, token_instance: Token, access_token: str
-) -> Union[Token, None]:
+async def get_active_sessions(
+    session: AsyncSession,
+    user_id: UUID,
+    limit: int,
+    after: Union[tuple, None] = None,
+) -> List[tuple]:
+    """
+    Returns up to `limit` active sessions of the user, newest first, as
+    (id, user_agent, ip_address, created_at, access_token_hash) rows.
+    `after` is the (created_at, id) of the last row of the previous page.
+    """
+    # only columns of ix_token_user_id_is_active_created_at, read from the index
+    statement = (
+        select(
+            Token.id,
+            Token.user_agent,
+            Token.ip_address,
+            Token.created_at,
+            Token.access_token_hash,
+        )
+        .where(Token.user_id == user_id, Token.is_active.is_(True))
+        .order_by(Token.created_at.desc(), Token.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(Token.created_at, Token.id) < after)
     try:
-        token_instance.access_token = access_token
-        session.add(token_instance)
-        session.commit()
-        session.refresh(token_instance)
+        return list((await session.exec(statement)).all())
+    except Exception as e:
+        logger.error(f"ERR GETTING ACTIVE SESSIONS: {e}")
+        return []
 
-        return token_instance
+
+async def rotate_tokens(
+    session: AsyncSession,
+    refresh_token: str,
+    access_token: str,
+    user_id: UUID,
+    token_version: int,
+    new_access_token: str,
+    new_refresh_token: Union[str, None] = None,
+) -> bool:
+    """
+    Swaps in the new credentials with a single UPDATE ... FROM user ... RETURNING.
+
+    Only an active row matching both presented tokens, owned by an active user
+    whose token_version is still the one the tokens were issued with, is
+    updated. Returns False when nothing matched.
+    """
+    values = {
+        "access_token_hash": token_digest(new_access_token),
+        "access_token_jti": token_jti(new_access_token),
+    }
+    if new_refresh_token:
+        values["refresh_token_hash"] = token_digest(new_refresh_token)
+        # right hand side is the value before the update
+        values["previous_refresh_token_hash"] = Token.refresh_token_hash
+
+    stmt = (
+        update(Token)
+        .where(
+            Token.refresh_token_hash == token_digest(refresh_token),
+            Token.access_token_hash == token_digest(access_token),
+            Token.user_id == user_id,
+            Token.is_active.is_(True),
+            User.id == Token.user_id,
+            User.is_active.is_(True),
+            User.token_version == token_version,
+        )
+        .values(**values)
+        .returning(Token.id)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        rotated = (await session.exec(stmt)).first() is not None
+        await session.commit()
+        return rotated
     except Exception as e:
-        logger.error(f"ERR UPDATING ACCESS TOKEN: {e}")
-        return None
+        await session.rollback()
+        logger.error(f"ERR ROTATING TOKENS: {e}")
+        return False
+
+
+async def revoke_reused_refresh_token(
+    session: AsyncSession, refresh_token: str, grace: float
+) -> bool:
+    """
+    Called after a failed rotation. A refresh token that was rotated out more
+    than `grace` seconds ago and is presented again has leaked: the session it
+    belongs to is deactivated and its current access token revoked.
+    Returns True when a session was revoked.
+    """
+    rotated_before = datetime.now(timezone.utc) - timedelta(seconds=grace)
+    stmt = (
+        update(Token)
+        .where(
+            Token.previous_refresh_token_hash == token_digest(refresh_token),
+            Token.is_active.is_(True),
+            Token.updated_at < rotated_before,
+        )
+        .values(is_active=False)
+        .returning(Token.user_id, Token.access_token_jti, Token.access_token_hash)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        row = (await session.exec(stmt)).first()
+        if row is None:
+            await session.rollback()
+            return False
 
+        user_id, access_token_jti, access_token_hash = row
+        revocation = TokenRevocation(
+            user_id=user_id,
+            access_token_jti=access_token_jti,
+            access_token_hash=access_token_hash,
+            expires_at=_access_token_horizon(),
+        )
+        session.add(revocation)
+        await session.commit()
+        revocations.revoke_access_token(
+            access_token_jti, access_token_hash, revocation.expires_at.timestamp()
+        )
+        logger.warning(f"REFRESH TOKEN REUSE, REVOKED A SESSION OF USER {user_id}")
+        return True
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"ERR REVOKING REUSED REFRESH TOKEN: {e}")
+        return False
 
-def deactivate_user_current_token(session: Session, refresh_token: str) -> bool:
+
+async def deactivate_user_current_token(
+    session: AsyncSession, refresh_token: str
+) -> bool:
     try:
         # Lock the row to avoid races if multiple requests hit at once
         stmt = (
-            select(Token).where(Token.refresh_token == refresh_token).with_for_update()
+            select(Token)
+            .where(Token.refresh_token_hash == token_digest(refresh_token))
+            .with_for_update()
         )
-        token: Token | None = session.exec(stmt).one_or_none()
+        token: Token | None = (await session.exec(stmt)).one_or_none()
         if not token or token.is_active is False:
             return False
 
         token.is_active = False
-        session.commit()
+        # the access token issued with it stays valid until exp unless revoked too
+        revocation = TokenRevocation(
+            user_id=token.user_id,
+            access_token_jti=token.access_token_jti,
+            access_token_hash=token.access_token_hash,
+            expires_at=_access_token_horizon(),
+        )
+        session.add(revocation)
+        await session.commit()
+        revocations.revoke_access_token(
+            revocation.access_token_jti,
+            revocation.access_token_hash,
+            revocation.expires_at.timestamp(),
+        )
         return True
     except Exception:
-        session.rollback()
+        await session.rollback()
         logger.exception("ERR DEACTIVATING A TOKEN")
         return False
 
 
-def deactivate_all_tokens_for_user(session: Session, user_id: UUID) -> int:
+async def deactivate_session(
+    session: AsyncSession, user_id: UUID, token_id: UUID
+) -> bool:
+    """
+    Deactivates one of the user's sessions and revokes its access token.
+    Returns False when the user has no such active session.
+    """
+    stmt = (
+        update(Token)
+        .where(
+            Token.id == token_id,
+            Token.user_id == user_id,
+            Token.is_active.is_(True),
+        )
+        .values(is_active=False)
+        .returning(Token.access_token_jti, Token.access_token_hash)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        row = (await session.exec(stmt)).first()
+        if row is None:
+            await session.rollback()
+            return False
+
+        access_token_jti, access_token_hash = row
+        revocation = TokenRevocation(
+            user_id=user_id,
+            access_token_jti=access_token_jti,
+            access_token_hash=access_token_hash,
+            expires_at=_access_token_horizon(),
+        )
+        session.add(revocation)
+        await session.commit()
+        revocations.revoke_access_token(
+            access_token_jti, access_token_hash, revocation.expires_at.timestamp()
+        )
+        return True
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"ERR DEACTIVATING SESSION: {e}")
+        return False
+
+
+async def deactivate_all_tokens_for_user(session: AsyncSession, user_id: UUID) -> int:
     """
     Returns the number of rows deactivated.
     """
@@ -103,11 +297,63 @@ def deactivate_all_tokens_for_user(session: Session, user_id: UUID) -> int:
         )
         .execution_options(synchronize_session=False)
     )
+    bump_version = (
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+    )
     try:
-        result = session.exec(stmt)
-        session.commit()
+        result = await session.exec(stmt)
+        # already issued access tokens carry the old version and stop working
+        token_version = (await session.exec(bump_version)).scalar_one()
+        revocation = TokenRevocation(
+            user_id=user_id,
+            min_token_version=token_version,
+            expires_at=_access_token_horizon(),
+        )
+        session.add(revocation)
+        await session.commit()
+        revocations.revoke_user(
+            user_id, token_version, revocation.expires_at.timestamp()
+        )
+        invalidate_principal(user_id)
+        pin_to_primary(user_id)
         return max(result.rowcount or 0, 0)
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.exception("ERR DEACTIVATING ALL USER TOKENS: %s", e)
         return 0
+
+
+async def purge_tokens_batch(
+    session: AsyncSession,
+    expired_before: datetime,
+    inactive_before: datetime,
+    batch_size: int,
+) -> int:
+    """
+    Deletes up to batch_size tokens that are expired or were deactivated before inactive_before.
+    Returns the number of rows deleted.
+    """
+    # updated_at moves on every refresh, a row untouched for a refresh lifetime is expired
+    ids = (
+        select(Token.id)
+        .where(
+            or_(
+                Token.updated_at < expired_before,
+                and_(Token.is_active.is_(False), Token.updated_at < inactive_before),
+            )
+        )
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = delete(Token).where(Token.id.in_(ids.scalar_subquery()))
+    try:
+        result = await session.exec(stmt)
+        await session.commit()
+        return max(result.rowcount or 0, 0)
+    except Exception as e:
+        await session.rollback()
+        logger.exception("ERR PURGING TOKENS: %s", e)
+        return 0
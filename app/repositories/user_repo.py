@@ -1,16 +1,76 @@
-from sqlmodel import Session, select
+from sqlmodel import select, update, or_, tuple_
+from sqlalchemy import func, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
 import logging
-from typing import Union
+import re
+from typing import List, Union
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from app.models import User
+from app.models import TokenRevocation, User
+from app.models.user import SEARCH_DOCUMENT_SQL
+from app.core.security import password_hasher
+from app.core.principal import Principal, principal_cache, invalidate_principal
+from app.core.config import settings
+from app.core.replicas import (
+    is_request_pinned,
+    pin_to_primary,
+    use_primary_if_pinned,
+)
 from app.schemas.user import UserCreationSchema
 
 logger = logging.getLogger(__name__)
 
+# unique columns of the user table, in the order a violation is matched
+UNIQUE_USER_FIELDS = ("username", "email")
+UNIQUE_USER_INDEXES = {"ix_user_username": "username", "ix_user_email": "email"}
+# postgres DETAIL line of a unique violation: Key (email)=(a@b.c) already exists.
+UNIQUE_VIOLATION_KEY = re.compile(r"Key \((\w+)\)=")
 
-def get_user_by_email(session: Session, email: str) -> Union[User, None]:
+
+class UserFieldTaken(Exception):
+    """
+    Raised when a write hits the unique constraint of `field` ("email" or "username").
+    """
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} is already taken")
+        self.field = field
+
+
+def _taken_field(e: IntegrityError) -> Union[str, None]:
+    # asyncpg and psycopg expose the constraint name and the DETAIL line; the
+    # message itself holds the offending value, so it is never matched
+    orig = e.orig
+    cause = getattr(orig, "__cause__", None)
+    diag = getattr(orig, "diag", None)
+    constraint = getattr(cause, "constraint_name", None) or getattr(
+        diag, "constraint_name", None
+    )
+    if constraint:
+        return UNIQUE_USER_INDEXES.get(constraint)
+    detail = getattr(cause, "detail", None) or getattr(diag, "message_detail", None)
+    match = UNIQUE_VIOLATION_KEY.search(detail or "")
+    if match and match.group(1) in UNIQUE_USER_FIELDS:
+        return match.group(1)
+    return None
+
+
+def _announce_user_change(session: AsyncSession, user_id: UUID) -> None:
+    # a revocation row that revokes nothing; other workers drop their cached
+    # principal when they sync it (app.jobs.revocation_sync), past the cache
+    # ttl no worker can still hold the old one
+    session.add(
+        TokenRevocation(
+            user_id=user_id,
+            expires_at=datetime.now(timezone.utc)
+            + timedelta(seconds=settings.principal_cache_ttl),
+        )
+    )
+
+
+async def get_user_by_email(session: AsyncSession, email: str) -> Union[User, None]:
     """
     Retrieves a single user from the database based on their email address.
     """
@@ -19,7 +79,9 @@ def get_user_by_email(session: Session, email: str) -> Union[User, None]:
         statement = select(User).where(User.email == email)
 
         # Execute the statement and get the first result
-        user = session.exec(statement).first()
+        user = (await session.exec(statement)).first()
+        if user and use_primary_if_pinned(session, user.id):
+            await session.refresh(user)
 
         return user
     except Exception as e:
@@ -27,16 +89,17 @@ def get_user_by_email(session: Session, email: str) -> Union[User, None]:
         return None
 
 
-def get_user_by_id(session: Session, user_id: UUID) -> Union[User, None]:
+async def get_user_by_id(session: AsyncSession, user_id: UUID) -> Union[User, None]:
     """
     Retrieves a single user from the database based on their user id.
     """
     # Create a select statement to find the user with the matching user id
     try:
+        use_primary_if_pinned(session, user_id)
         statement = select(User).where(User.id == user_id)
 
         # Execute the statement and get the first result
-        user = session.exec(statement).first()
+        user = (await session.exec(statement)).first()
 
         return user
     except Exception as e:
@@ -44,64 +107,245 @@ def get_user_by_id(session: Session, user_id: UUID) -> Union[User, None]:
         return None
 
 
-def get_user_by_username(session: Session, username: str) -> Union[User, None]:
+async def get_principal_by_id(
+    session: AsyncSession, user_id: UUID
+) -> Union[Principal, None]:
     """
-    Retrieves a single user from the database based on their username.
+    Returns the cached principal for the user id, loading it from the database on a miss.
+
+    Requests pinned to the primary skip the cache: their client just changed
+    something, maybe on another worker whose invalidation hasn't reached
+    this one yet.
     """
-    # Create a select statement to find the user with the matching username
-    try:
-        statement = select(User).where(User.username == username)
+    if not is_request_pinned():
+        principal = principal_cache.get(user_id)
+        if principal is not None:
+            return principal
 
-        # Execute the statement and get the first result
-        user = session.exec(statement).first()
+    user = await get_user_by_id(session=session, user_id=user_id)
+    if not user:
+        return None
 
-        return user
+    principal = Principal.from_user(user)
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+async def is_user_admin(session: AsyncSession, user_id: UUID) -> bool:
+    try:
+        statement = select(User.is_admin).where(
+            User.id == user_id, User.is_active.is_(True)
+        )
+        return bool((await session.exec(statement)).first())
     except Exception as e:
-        logger.error(f"ERR GETTING USER BY USERNAME: {e}")
-        return None
+        logger.error(f"ERR CHECKING ADMIN FLAG: {e}")
+        return False
 
 
-def create_user(session: Session, user_data: UserCreationSchema) -> bool:
+async def create_user(session: AsyncSession, user_data: UserCreationSchema) -> bool:
+    """
+    Inserts the user, raises UserFieldTaken on a duplicate email or username.
+
+    A taken email or username is looked up before hashing the password, so
+    signups that can't succeed never cost a hash; the unique constraints
+    still catch a concurrent signup that gets in between.
+    """
     try:
-        user = User(
-            first_name=user_data.first_name,
-            last_name=user_data.last_name,
-            email=user_data.email,
-            username=user_data.username,
-            is_active=True,
-            is_email_verified=False,
+        statement = (
+            select(User.username, User.email)
+            .where(
+                or_(
+                    User.username == user_data.username,
+                    User.email == user_data.email,
+                )
+            )
+            .limit(2)
         )
-        user.set_password(user_data.password)
+        existing = (await session.exec(statement)).all()
+    except Exception as e:
+        logger.error(f"ERR CREATING USER: {e}")
+        return False
+    for field in UNIQUE_USER_FIELDS:
+        if any(getattr(row, field) == getattr(user_data, field) for row in existing):
+            raise UserFieldTaken(field)
 
+    user = User(
+        first_name=user_data.first_name,
+        last_name=user_data.last_name,
+        email=user_data.email,
+        username=user_data.username,
+        is_active=True,
+        is_email_verified=False,
+    )
+    # outside the try: PasswordHasherBusy must reach the caller as a 503
+    await user.set_password_async(user_data.password)
+
+    try:
         session.add(user)
-        session.commit()
+        await session.commit()
 
         return True
+    except IntegrityError as e:
+        await session.rollback()
+        field = _taken_field(e)
+        if field:
+            raise UserFieldTaken(field)
+        logger.error(f"ERR CREATING USER: {e}")
+        return False
     except Exception as e:
         logger.error(f"ERR CREATING USER: {e}")
         return False
 
 
-def update_user_password(session: Session, user: User, new_password: str) -> bool:
+async def update_user_password(
+    session: AsyncSession, user: User, new_password: str
+) -> bool:
+    password_hash = await password_hasher.hash(new_password)
+
     try:
-        user.set_password(new_password)
+        user.password_hash = password_hash
         user.last_password_updated_at = datetime.now()
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        _announce_user_change(session, user.id)
+        await session.commit()
+        await session.refresh(user)
+        invalidate_principal(user.id)
+        pin_to_primary(user.id)
         return True
     except Exception as e:
         logger.error(f"ERR UPDATING USER PASSWORD: {e}")
         return False
 
 
-def is_username_available(session: Session, new_username: str, user_id: UUID) -> bool:
+async def replace_password_hash(
+    session: AsyncSession, user_id: UUID, old_hash: str, new_hash: str
+) -> bool:
+    """
+    Stores a rehash of the same password (new scheme or cost). Only replaces
+    `old_hash`, so a password changed in the meantime is never overwritten.
+    """
     try:
-        statement = select(User).where(
-            User.username == new_username, User.id != user_id
+        statement = (
+            update(User)
+            .where(User.id == user_id, User.password_hash == old_hash)
+            # not a profile change, keeps updated_at and with it the profile ETag
+            .values(password_hash=new_hash, updated_at=User.updated_at)
+            .execution_options(synchronize_session=False)
         )
-        is_valid = session.exec(statement).first() == None
-        return is_valid
+        result = await session.exec(statement)
+        await session.commit()
+        return bool(result.rowcount)
     except Exception as e:
-        logger.error(f"ERR CHECKING FOR USERNAME ACCEPTANCE: {e}")
+        await session.rollback()
+        logger.error(f"ERR REPLACING PASSWORD HASH: {e}")
         return False
+
+
+async def update_user_profile(
+    session: AsyncSession, user_id: UUID, changes: dict
+) -> Union[User, None]:
+    """
+    Applies the changes with a single UPDATE ... RETURNING, no prior read or
+    availability check. Raises UserFieldTaken when the new username is taken.
+    """
+    try:
+        statement = (
+            update(User)
+            .where(User.id == user_id)
+            .values(**changes, last_profile_updated_at=func.now())
+            .returning(User)
+            .execution_options(synchronize_session=False)
+        )
+        user = (await session.exec(statement)).scalar_one_or_none()
+        if user:
+            _announce_user_change(session, user.id)
+        await session.commit()
+        if user:
+            invalidate_principal(user.id)
+            pin_to_primary(user.id)
+        return user
+    except IntegrityError as e:
+        await session.rollback()
+        field = _taken_field(e)
+        if field:
+            raise UserFieldTaken(field)
+        logger.error(f"ERR UPDATING USER PROFILE: {e}")
+        return None
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"ERR UPDATING USER PROFILE: {e}")
+        return None
+
+
+# below this many characters a substring can't be looked up by trigrams
+MIN_SUBSTRING_SEARCH_LENGTH = 3
+
+ADMIN_USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.first_name,
+    User.last_name,
+    User.is_active,
+    User.is_email_verified,
+    User.is_admin,
+    User.created_at,
+)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_users_statement(
+    query: str,
+    limit: int,
+    prefix: bool = False,
+    after: Union[tuple, None] = None,
+):
+    """
+    SELECT of up to `limit` users, newest first, as rows of ADMIN_USER_COLUMNS.
+
+    A non-empty `query` must be a substring of the first or last name,
+    username or email, or a prefix of one of them when `prefix` is set (or
+    the query is too short for a substring lookup). Both are LIKE patterns
+    over SEARCH_DOCUMENT_SQL, served by its trigram index.
+    `after` is the (created_at, id) of the last row of the previous page.
+    """
+    statement = (
+        select(*ADMIN_USER_COLUMNS)
+        .order_by(User.created_at.desc(), User.id.desc())
+        .limit(limit)
+    )
+    if query:
+        term = _escape_like(query)
+        if prefix or len(query) < MIN_SUBSTRING_SEARCH_LENGTH:
+            pattern = f"% {term}%"
+        else:
+            pattern = f"%{term}%"
+        statement = statement.where(
+            literal_column(SEARCH_DOCUMENT_SQL).like(pattern, escape="\\")
+        )
+    if after is not None:
+        statement = statement.where(tuple_(User.created_at, User.id) < after)
+    return statement
+
+
+async def search_users(
+    session: AsyncSession,
+    query: str,
+    limit: int,
+    prefix: bool = False,
+    after: Union[tuple, None] = None,
+) -> List[tuple]:
+    """
+    Runs search_users_statement, returns no rows on errors.
+    """
+    statement = search_users_statement(
+        query=query, limit=limit, prefix=prefix, after=after
+    )
+    try:
+        return list((await session.exec(statement)).all())
+    except Exception as e:
+        logger.error(f"ERR SEARCHING USERS: {e}")
+        return []
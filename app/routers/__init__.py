@@ -1,2 +1,5 @@
 from .auth import router as authRouter
 from .user import router as userRouter
+from .ws import router as wsRouter
+from .admin import router as adminRouter
+from .well_known import router as wellKnownRouter
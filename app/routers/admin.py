@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Depends, Query, status
+from typing import Literal
+
+# local imports
+from app.core.db import AsyncSession, get_async_read_session
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.rate_limit import normalize_identifier
+from app.core.responses import JSONResponse
+from app.middleware import authenticator, require_admin
+from app.repositories.user_repo import search_users
+
+router = APIRouter(
+    prefix="/admin",
+    dependencies=[Depends(authenticator), Depends(require_admin)],
+)
+
+
+@router.get("/users/")
+async def list_users(
+    q: str = Query(default="", max_length=100),
+    match: Literal["contains", "prefix"] = "contains",
+    limit: int = Query(default=50, ge=1, le=100),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """
+    Users newest first, optionally filtered by `q` over name, username and email.
+    Queries shorter than 3 characters always match as a prefix.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return JSONResponse(
+                {"message": "Invalid cursor."},
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+
+    # stored identifiers are folded the same way
+    query = normalize_identifier(q)
+    # one extra row tells whether there is a next page
+    rows = await search_users(
+        session=session,
+        query=query,
+        limit=limit + 1,
+        prefix=match == "prefix",
+        after=after,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return JSONResponse(
+        {
+            "users": [
+                {
+                    "id": str(row.id),
+                    "username": row.username,
+                    "email": row.email,
+                    "first_name": row.first_name,
+                    "last_name": row.last_name,
+                    "is_active": row.is_active,
+                    "is_email_verified": row.is_email_verified,
+                    "is_admin": row.is_admin,
+                    "joined_at": int(row.created_at.timestamp()),
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        },
+        status_code=status.HTTP_200_OK,
+    )
@@ -1,22 +1,30 @@
 from fastapi import APIRouter, Request, Depends, status
-from fastapi.responses import JSONResponse
 from datetime import datetime
 
 
 # local imports
-from app.core.db import Session, get_session
+from app.core.config import settings
+from app.core.db import AsyncSession, get_async_session, get_async_read_session
 from app.repositories.user_repo import (
     get_user_by_email,
-    get_user_by_id,
-    get_user_by_username,
     create_user,
+    replace_password_hash,
+    UserFieldTaken,
 )
 from app.repositories.token_repo import (
-    get_token_by_refresh_token,
     create_token,
-    update_access_token,
+    rotate_tokens,
+    revoke_reused_refresh_token,
 )
 from app.schemas.token import TokenCreationSchema
+from app.core.responses import JSONResponse
+from app.core.rate_limit import (
+    login_ip_limit,
+    login_account_limit,
+    signup_ip_limit,
+    signup_account_limit,
+    normalize_identifier,
+)
 from app.core.jwt import generate_token, decode_token
 
 from app.models import Token, User
@@ -26,7 +34,9 @@ router = APIRouter(prefix="/auth")
 
 
 @router.get("/refresh-token")
-async def refresh_token(request: Request, session: Session = Depends(get_session)):
+async def refresh_token(
+    request: Request, session: AsyncSession = Depends(get_async_session)
+):
     refresh = request.cookies.get("refresh", "")
     access = request.cookies.get("access", "")
     if not refresh or not access:
@@ -45,7 +55,7 @@ async def refresh_token(request: Request, session: Session = Depends(get_session
         )
 
     access_token_payload = decode_token(token=access)
-    if access_token_payload or access_token_payload.exp > int(
+    if access_token_payload and access_token_payload.exp > int(
         datetime.now().timestamp()
     ):
         response = JSONResponse(
@@ -59,34 +69,54 @@ async def refresh_token(request: Request, session: Session = Depends(get_session
             secure=True,
             samesite="Lax",
         )
+        return response
 
-    else:
-        token_instance = get_token_by_refresh_token(
-            session=session, refresh_token=refresh
+    # new tokens carry the refresh token's version, the rotation only succeeds
+    # while the user's token_version still equals it
+    identity = refresh_token_payload.identity
+    access_token = generate_token(
+        identity=identity, token_type="access", version=refresh_token_payload.ver
+    )
+    new_refresh_token = None
+    if settings.refresh_token_rotation:
+        new_refresh_token = generate_token(
+            identity=identity, token_type="refresh", version=refresh_token_payload.ver
         )
-        if not token_instance or token_instance.access_token != access:
-            return JSONResponse(
-                {"message": "Session expired, Please login again!"},
-                status_code=status.HTTP_401_UNAUTHORIZED,
-            )
 
-        user = get_user_by_id(session=session, user_id=token_instance.user_id)
-        if not user or not user.is_active:
-            return JSONResponse({"message": "Unauthorized"}, status_code=401)
-
-        access_token = generate_token(
-            identity=token_instance.user_id, token_type="access"
-        )
-        updated_token_instance = update_access_token(
-            session=session, token_instance=token_instance, access_token=access_token
+    if not await rotate_tokens(
+        session=session,
+        refresh_token=refresh,
+        access_token=access,
+        user_id=identity,
+        token_version=refresh_token_payload.ver,
+        new_access_token=access_token,
+        new_refresh_token=new_refresh_token,
+    ):
+        if new_refresh_token:
+            await revoke_reused_refresh_token(
+                session=session,
+                refresh_token=refresh,
+                grace=settings.refresh_token_reuse_grace,
+            )
+        return JSONResponse(
+            {"message": "Session expired, Please login again!"},
+            status_code=status.HTTP_401_UNAUTHORIZED,
         )
 
-        response = JSONResponse(
-            {"message": "refreshed successfully!"}, status_code=status.HTTP_201_CREATED
-        )
+    response = JSONResponse(
+        {"message": "refreshed successfully!"}, status_code=status.HTTP_201_CREATED
+    )
+    response.set_cookie(
+        "access",
+        access_token,
+        httponly=True,
+        secure=True,
+        samesite="Lax",
+    )
+    if new_refresh_token:
         response.set_cookie(
-            "access",
-            updated_token_instance.access_token,
+            "refresh",
+            new_refresh_token,
             httponly=True,
             secure=True,
             samesite="Lax",
@@ -98,9 +128,13 @@ async def refresh_token(request: Request, session: Session = Depends(get_session
 async def login(
     payload: LoginRequestSchema,
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
 ):
-    user = get_user_by_email(session=session, email=payload.email)
+    # before the lookup and the bcrypt verify, raises a 429 when over the limit
+    await login_ip_limit.hit(request.client.host)
+    await login_account_limit.hit(normalize_identifier(payload.email))
+
+    user = await get_user_by_email(session=session, email=payload.email)
     if not user:
         return JSONResponse(
             {
@@ -109,16 +143,29 @@ async def login(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    if not user.verify_password(payload.password):
+    verified, new_hash = await user.verify_and_update_password_async(payload.password)
+    if not verified:
         return JSONResponse(
             {
                 "message": "Incorrect password provided, Please provide correct password or Try clicking on 'Forgot Password' if you don't remember it!"
             },
             status_code=status.HTTP_400_BAD_REQUEST,
         )
+    if new_hash:
+        # outdated scheme or cost, upgraded while the plain password is at hand
+        await replace_password_hash(
+            session=session,
+            user_id=user.id,
+            old_hash=user.password_hash,
+            new_hash=new_hash,
+        )
 
-    access_token = generate_token(identity=user.id, token_type="access")
-    refresh_token = generate_token(identity=user.id, token_type="refresh")
+    access_token = generate_token(
+        identity=user.id, token_type="access", version=user.token_version
+    )
+    refresh_token = generate_token(
+        identity=user.id, token_type="refresh", version=user.token_version
+    )
 
     if not access_token or not refresh_token:
         return JSONResponse(
@@ -127,7 +174,7 @@ async def login(
             },
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
-    token = create_token(
+    token = await create_token(
         session=session,
         token_data=TokenCreationSchema(
             refresh_token=refresh_token,
@@ -149,40 +196,50 @@ async def login(
 
     response = JSONResponse({"message": "login successful!"})
     response.set_cookie(
-        "access", token.access_token, httponly=True, secure=True, samesite="Lax"
+        "access", access_token, httponly=True, secure=True, samesite="Lax"
     )
     response.set_cookie(
-        "refresh", token.refresh_token, httponly=True, secure=True, samesite="Lax"
+        "refresh", refresh_token, httponly=True, secure=True, samesite="Lax"
     )
     return response
 
 
 @router.post("/signup")
-async def signup(payload: SignupRequestSchema, session: Session = Depends(get_session)):
-    if get_user_by_email(session=session, email=payload.email) != None:
-        return JSONResponse(
-            {
-                "message": "This email is already registered with a account, Try a different email or login!"
-            },
-            status_code=status.HTTP_400_BAD_REQUEST,
-        )
-
-    if get_user_by_username(session=session, username=payload.username) != None:
+async def signup(
+    payload: SignupRequestSchema,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+):
+    await signup_ip_limit.hit(request.client.host)
+    await signup_account_limit.hit(payload.email)
+    await signup_account_limit.hit(payload.username)
+
+    # one INSERT, the unique constraints on email and username reject duplicates
+    try:
+        created = await create_user(
+            session=session,
+            user_data=UserCreationSchema(
+                first_name=payload.first_name,
+                last_name=payload.last_name,
+                email=payload.email,
+                username=payload.username,
+                password=payload.password,
+            ),
+        )
+    except UserFieldTaken as e:
+        if e.field == "email":
+            return JSONResponse(
+                {
+                    "message": "This email is already registered with a account, Try a different email or login!"
+                },
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
         return JSONResponse(
             {"message": "This username is already taken, Try a different one!"},
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    if not create_user(
-        session=session,
-        user_data=UserCreationSchema(
-            first_name=payload.first_name,
-            last_name=payload.last_name,
-            email=payload.email,
-            username=payload.username,
-            password=payload.password,
-        ),
-    ):
+    if not created:
         return JSONResponse(
             {
                 "message": "We're having problem creating a account right now, Please try again after sometime!"
@@ -1,17 +1,34 @@
-from fastapi import APIRouter, Depends, status, Request
-from sqlmodel import Session
-from fastapi.responses import JSONResponse
-from datetime import datetime
+from fastapi import APIRouter, Depends, Query, status, Request
+from operator import attrgetter
+from uuid import UUID
 
 # local imports
-from app.core.db import get_session
+from app.core.db import AsyncSession, get_async_session
 from app.models import User
+from app.core.principal import Principal
+from app.core.conditional import (
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    validator_headers,
+)
+from app.core.jwt import token_digest
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.responses import JSONResponse
+from app.core.websocket import ws_manager
 from app.middleware import authenticator
 from app.schemas.user import ChangePassRequestSchema, UpdateProfileRequestSchema
-from app.repositories.user_repo import update_user_password, is_username_available
+from app.repositories.user_repo import (
+    get_user_by_id,
+    update_user_password,
+    update_user_profile,
+    UserFieldTaken,
+)
 from app.repositories.token_repo import (
     deactivate_user_current_token,
     deactivate_all_tokens_for_user,
+    deactivate_session,
+    get_active_sessions,
 )
 
 router = APIRouter(prefix="/user/profile")
@@ -23,105 +40,145 @@ def clear_auth_cookies(response: JSONResponse, *, domain: str | None = None) ->
     response.delete_cookie("refresh", path="/", domain=domain)
 
 
-def serialize_user(user: User) -> dict:
-    created_at = user.created_at
-    last_profile_updated_at = user.last_profile_updated_at
-    last_password_updated_at = user.last_password_updated_at
+_USER_FIELDS = attrgetter(
+    "id",
+    "first_name",
+    "last_name",
+    "email",
+    "username",
+    "is_email_verified",
+    "created_at",
+    "last_profile_updated_at",
+    "last_password_updated_at",
+)
+
+
+def _serialize_user(user: User | Principal) -> dict:
+    (
+        user_id,
+        first_name,
+        last_name,
+        email,
+        username,
+        is_email_verified,
+        created_at,
+        last_profile_updated_at,
+        last_password_updated_at,
+    ) = _USER_FIELDS(user)
 
     return {
-        "id": str(user.id),
-        "full_name": user.get_full_name(),
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "email": user.email,
-        "username": user.username,
-        "is_email_verified": user.is_email_verified,
+        "id": str(user_id),
+        "full_name": f"{first_name} {last_name}",
+        "first_name": first_name,
+        "last_name": last_name,
+        "email": email,
+        "username": username,
+        "is_email_verified": is_email_verified,
         "joined_at": int(created_at.timestamp()),
         "last_profile_updated_at": int(last_profile_updated_at.timestamp()),
         "last_password_updated_at": int(last_password_updated_at.timestamp()),
     }
 
 
+def serialize_user(user: User | Principal) -> dict:
+    # cached principals are serialized once and reused until they are replaced
+    if type(user) is Principal:
+        return user.serialized(_serialize_user)
+    return _serialize_user(user)
+
+
 @router.get("/", dependencies=[Depends(authenticator)])
 async def profile(request: Request):
-    user: User = request.state.user
-    return JSONResponse({"user": serialize_user(user)}, status_code=status.HTTP_200_OK)
+    user: Principal = request.state.user
+    validators = user.validators()
+    # polling clients are answered from the cached principal, nothing is serialized
+    if is_not_modified(request.headers, validators["ETag"], user.updated_at):
+        return not_modified_response(validators)
+    return JSONResponse(
+        {"user": serialize_user(user)},
+        status_code=status.HTTP_200_OK,
+        headers=validators,
+    )
 
 
 @router.patch("/update/", dependencies=[Depends(authenticator)])
 async def update_profile(
     payload: UpdateProfileRequestSchema,
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    user: User = request.state.user
+    principal: Principal = request.state.user
     changes = {}
     new_username = payload.username
 
-    if new_username != user.username:
-        if is_username_available(
-            session=session, new_username=new_username, user_id=user.id
-        ):
-            changes["username"] = new_username
-        else:
-            return JSONResponse(
-                {"message": "Username is already taken."},
-                status_code=status.HTTP_409_CONFLICT,
-            )
+    if new_username != principal.username:
+        # availability is left to the unique constraint, see update_user_profile
+        changes["username"] = new_username
 
     new_first = payload.first_name
-    if new_first != user.first_name:
+    if new_first != principal.first_name:
         changes["first_name"] = new_first
 
     new_last = payload.last_name
-    if new_last != user.last_name:
+    if new_last != principal.last_name:
         changes["last_name"] = new_last
 
     if not changes:
         return JSONResponse(
-            {"user": serialize_user(user)}, status_code=status.HTTP_200_OK
+            {"user": serialize_user(principal)}, status_code=status.HTTP_200_OK
         )
 
     try:
-        for k, v in changes.items():
-            setattr(user, k, v)
-
-        if len(changes):
-            user.last_profile_updated_at = datetime.now()
-
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-    except Exception:
-        session.rollback()
+        user = await update_user_profile(
+            session=session, user_id=principal.id, changes=changes
+        )
+    except UserFieldTaken:
+        return JSONResponse(
+            {"message": "Username is already taken."},
+            status_code=status.HTTP_409_CONFLICT,
+        )
+    if not user:
         return JSONResponse(
             {"message": "Failed to update profile, please try again."},
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    return JSONResponse({"user": serialize_user(user)}, status_code=status.HTTP_200_OK)
+    serialized = serialize_user(user)
+    # the user's other open tabs/devices on this worker
+    ws_manager.send_to_user(
+        principal.id, {"type": "profile.updated", "user": serialized}
+    )
+    # same validators the profile GET will send for this version
+    return JSONResponse(
+        {"user": serialized},
+        status_code=status.HTTP_200_OK,
+        headers=validator_headers(make_etag(user.id, user.updated_at), user.updated_at),
+    )
 
 
 @router.patch("/change-password/", dependencies=[Depends(authenticator)])
 async def change_password(
     payload: ChangePassRequestSchema,
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    user: User | None = request.state.user
-    if not user or not user.verify_password(payload.current_password):
+    principal: Principal = request.state.user
+    # the principal carries no password hash, load the row for verification
+    user = await get_user_by_id(session=session, user_id=principal.id)
+    if not user or not await user.verify_password_async(payload.current_password):
         return JSONResponse(
             {"message": "Current password is incorrect."},
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    if user.verify_password(payload.new_password):
+    # current password just verified, so comparing the raw values is enough
+    if payload.new_password == payload.current_password:
         return JSONResponse(
             {"message": "Your new password can not be your current password!"},
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    if not update_user_password(
+    if not await update_user_password(
         session=session, user=user, new_password=payload.new_password
     ):
         return JSONResponse(
@@ -129,17 +186,84 @@ async def change_password(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    deactivate_all_tokens_for_user(session=session, user_id=user.id)
+    await deactivate_all_tokens_for_user(session=session, user_id=user.id)
+    # other workers close theirs at the next heartbeat after the revocation sync
+    ws_manager.close_user(user.id)
     response = JSONResponse({"message": "Password updated. Please log in again."})
     clear_auth_cookies(response)
     return response
 
 
+@router.get("/sessions/", dependencies=[Depends(authenticator)])
+async def sessions(
+    request: Request,
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_async_session),
+):
+    principal: Principal = request.state.user
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return JSONResponse(
+                {"message": "Invalid cursor."},
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+
+    # one extra row tells whether there is a next page
+    rows = await get_active_sessions(
+        session=session, user_id=principal.id, limit=limit + 1, after=after
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+
+    current = token_digest(request.cookies.get("access", ""))
+    return JSONResponse(
+        {
+            "sessions": [
+                {
+                    "id": str(token_id),
+                    "user_agent": user_agent,
+                    "ip_address": ip_address,
+                    "created_at": int(created_at.timestamp()),
+                    "current": access_token_hash == current,
+                }
+                for token_id, user_agent, ip_address, created_at, access_token_hash in rows
+            ],
+            "next_cursor": next_cursor,
+        },
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.delete("/sessions/{session_id}/", dependencies=[Depends(authenticator)])
+async def revoke_session(
+    session_id: UUID,
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+):
+    principal: Principal = request.state.user
+    if not await deactivate_session(
+        session=session, user_id=principal.id, token_id=session_id
+    ):
+        return JSONResponse(
+            {"message": "Session not found."},
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    # its websockets are closed by the next heartbeat, the access token is revoked
+    return JSONResponse({"message": "Session revoked."}, status_code=status.HTTP_200_OK)
+
+
 @router.get("/logout")
-async def logout(request: Request, session: Session = Depends(get_session)):
+async def logout(request: Request, session: AsyncSession = Depends(get_async_session)):
     refresh_token = request.cookies.get("refresh")
     if refresh_token:
-        deactivate_user_current_token(session=session, refresh_token=refresh_token)
+        await deactivate_user_current_token(
+            session=session, refresh_token=refresh_token
+        )
 
     response = JSONResponse({"message": "logged out"})
     clear_auth_cookies(response)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+# local imports
+from app.core.conditional import is_not_modified, not_modified_response
+from app.core.config import settings
+from app.core.jwt import get_jwt_codec
+
+router = APIRouter(prefix="/.well-known")
+
+
+@router.get("/jwks.json")
+async def jwks(request: Request):
+    """
+    Public keys that verify our tokens, so other services can check them
+    locally. Empty while tokens are signed with JWT_SECRET.
+    """
+    codec = get_jwt_codec()
+    headers = {
+        "ETag": codec.jwks_etag,
+        "Cache-Control": f"public, max-age={settings.jwt_jwks_max_age}",
+    }
+    if is_not_modified(request.headers, codec.jwks_etag, None):
+        return not_modified_response(headers)
+    return Response(codec.jwks, media_type="application/json", headers=headers)
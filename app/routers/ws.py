@@ -0,0 +1,66 @@
+from fastapi import APIRouter, WebSocket
+from datetime import datetime
+import logging
+
+# local imports
+from app.core.db import async_read_session_maker
+from app.core.jwt import decode_token
+from app.core.revocation import revocations
+from app.core.websocket import (
+    ws_manager,
+    CLOSE_POLICY_VIOLATION,
+    CLOSE_TRY_AGAIN_LATER,
+)
+from app.repositories.user_repo import get_principal_by_id
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ws")
+
+
+@router.websocket("/")
+async def gateway(websocket: WebSocket):
+    """
+    Server to client events for the logged in user, authenticated by the access cookie.
+
+    Messages are JSON objects with a "type". The server sends {"type":"ping"}
+    every WS_HEARTBEAT_INTERVAL seconds; clients that send nothing for
+    WS_IDLE_TIMEOUT are disconnected, so they should reply with {"type":"pong"}
+    (sending {"type":"ping"} gets a pong back).
+    """
+    access = websocket.cookies.get("access", "")
+    payload = decode_token(token=access) if access else None
+    if (
+        not payload
+        or payload.type != "access"
+        or payload.exp < int(datetime.now().timestamp())
+        or revocations.is_revoked(payload, access)
+    ):
+        # closing before accept rejects the handshake with a 403
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
+
+    if ws_manager.is_full():
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        return
+
+    # a session of its own: a dependency's would hold its connection for the
+    # whole lifetime of the socket
+    try:
+        async with async_read_session_maker() as session:
+            principal = await get_principal_by_id(
+                session=session, user_id=payload.identity
+            )
+    except Exception as e:
+        logger.error(f"ERR AT WEBSOCKET GATEWAY: {e}")
+        principal = None
+    if not principal or not principal.is_active:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    connection = ws_manager.add(websocket, access, payload)
+    try:
+        await connection.run()
+    finally:
+        ws_manager.remove(connection)
@@ -0,0 +1,233 @@
+"""
+Production launcher, run with `python -m app`.
+
+The app is imported once in the parent and the listening socket bound there,
+then N uvicorn workers are forked from it. Workers share the imported code
+copy-on-write and accept from the same socket; each one runs the lifespan
+(and with it the db and bcrypt warm-up) after the fork, so no connection,
+thread or event loop is ever shared between processes.
+
+The parent restarts workers that die, and on SIGTERM/SIGINT tells every
+worker to stop accepting and finish in-flight requests, killing the ones
+still running after SERVER_GRACEFUL_TIMEOUT.
+
+Metrics live in each worker, which one answers a scrape is up to the kernel.
+The workers share their samples through METRICS_DIR, a temporary directory
+unless configured, so every /metrics response covers all of them.
+"""
+
+from typing import Dict
+import argparse
+import importlib.util
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# a worker that dies sooner than this after starting counts as crashing, and
+# its restarts back off exponentially up to RESTART_BACKOFF_MAX secs
+RESTART_RESET_AFTER = 30
+RESTART_BACKOFF_MIN = 0.5
+RESTART_BACKOFF_MAX = 30
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def size_password_hash_pool(workers: int) -> None:
+    """
+    Splits the cpus between the workers' hashing pools unless configured,
+    one pool per cpu in every worker would oversubscribe the machine.
+    """
+    # an unset password_hash_max_concurrency follows the pool size
+    if "password_hash_workers" in settings.model_fields_set:
+        return
+    settings.password_hash_workers = max((os.cpu_count() or 1) // workers, 1)
+
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.children: Dict[int, int] = {}  # pid -> worker index
+        self.started: Dict[int, float] = {}  # worker index -> monotonic start
+        self.failures: Dict[int, int] = {}  # worker index -> quick crashes in a row
+        self.restart_at: Dict[int, float] = {}  # worker index -> monotonic due time
+        self.should_exit = False
+
+    def spawn(self, index: int, sockets: list) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            self.started[index] = time.monotonic()
+            return
+
+        # child: uvicorn installs its own handlers for a graceful stop
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=sockets)
+        except BaseException:
+            logger.exception(f"ERR IN WORKER {index}")
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def restart_delay(self, index: int) -> float:
+        lifetime = time.monotonic() - self.started.get(index, 0)
+        if lifetime >= RESTART_RESET_AFTER:
+            self.failures[index] = 0
+            return 0
+        failures = self.failures.get(index, 0) + 1
+        self.failures[index] = failures
+        return min(RESTART_BACKOFF_MIN * 2 ** (failures - 1), RESTART_BACKOFF_MAX)
+
+    def handle_exit(self, signum, frame) -> None:
+        self.should_exit = True
+
+    def run(self) -> None:
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self.handle_exit)
+        signal.signal(signal.SIGINT, self.handle_exit)
+
+        for index in range(self.workers):
+            self.spawn(index, [sock])
+        logger.info(f"STARTED {self.workers} WORKERS ON PID {os.getpid()}")
+
+        while not self.should_exit:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.children and not self.should_exit:
+                index = self.children.pop(pid)
+                delay = self.restart_delay(index)
+                logger.error(
+                    f"WORKER {index} (PID {pid}) EXITED WITH {status}, "
+                    f"RESTARTING IN {delay:.1f}s"
+                )
+                self.restart_at[index] = time.monotonic() + delay
+
+            now = time.monotonic()
+            for index, due in list(self.restart_at.items()):
+                if due <= now and not self.should_exit:
+                    del self.restart_at[index]
+                    self.spawn(index, [sock])
+            time.sleep(0.2)
+
+        self.stop()
+        sock.close()
+
+    def stop(self) -> None:
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        # uvicorn drains for up to timeout_graceful_shutdown, then runs the lifespan shutdown
+        deadline = time.monotonic() + settings.server_graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+
+        for pid in self.children:
+            logger.error(f"KILLING WORKER PID {pid} AFTER GRACEFUL TIMEOUT")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.server_workers or os.cpu_count() or 1,
+    )
+    parser.add_argument(
+        "--reload", action="store_true", help="single auto-reloading dev worker"
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+    loop = "uvloop" if available("uvloop") else "asyncio"
+    http = "httptools" if available("httptools") else "h11"
+
+    if args.reload:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            loop=loop,
+            http=http,
+            log_level=args.log_level,
+        )
+        return
+
+    workers = max(args.workers, 1)
+    size_password_hash_pool(workers)
+    from app.core.security import calibrate_password_hash, check_password_hash_backend
+
+    # in the parent, a missing backend stops the launch instead of every worker
+    check_password_hash_backend()
+    if settings.password_hash_target_ms > 0:
+        # once for all workers, so they agree on the cost
+        calibrate_password_hash(settings.password_hash_target_ms)
+        settings.password_hash_target_ms = 0
+
+    temporary_metrics_dir = None
+    if settings.metrics_enabled and workers > 1:
+        if settings.metrics_dir:
+            os.makedirs(settings.metrics_dir, exist_ok=True)
+        else:
+            temporary_metrics_dir = tempfile.mkdtemp(prefix="metrics-")
+            settings.metrics_dir = temporary_metrics_dir
+
+    # preload: everything imported here is shared copy-on-write by the workers
+    from app.main import app
+
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop=loop,
+        http=http,
+        lifespan="on",
+        log_level=args.log_level,
+        timeout_graceful_shutdown=settings.server_graceful_timeout,
+        ws_max_size=settings.ws_max_message_size,
+        ws_per_message_deflate=settings.ws_per_message_deflate,
+    )
+    logger.info(f"SERVING ON {args.host}:{args.port} WITH loop={loop} http={http}")
+    try:
+        Supervisor(config, workers).run()
+    finally:
+        if temporary_metrics_dir:
+            shutil.rmtree(temporary_metrics_dir, ignore_errors=True)
@@ -0,0 +1,85 @@
+"""
+Per-request cost of decoding the `access` cookie.
+
+Compares the previous path (python-jose + a TokenPayloadSchema per call)
+with JWTCodec, both on a cold cache and on the verified-token cache, then
+the cost of signing and of a cold verification with each asymmetric key type.
+
+    python -m benchmarks.bench_jwt [--number 20000]
+"""
+
+import argparse
+import os
+import timeit
+import uuid
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+
+from jose import jwt as jose_jwt
+
+from app.core.jwt import JWTCodec, generate_token, load_pem_key
+from app.schemas.token import TokenPayloadSchema
+
+
+def jose_decode(token: str, secret: str) -> TokenPayloadSchema:
+    payload = jose_jwt.decode(token=token, algorithms="HS256", key=secret)
+    return TokenPayloadSchema(**payload)
+
+
+def generate_pems() -> dict:
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+    from cryptography.hazmat.primitives.serialization import (
+        Encoding,
+        NoEncryption,
+        PrivateFormat,
+    )
+
+    keys = {
+        "EdDSA": ed25519.Ed25519PrivateKey.generate(),
+        "ES256": ec.generate_private_key(ec.SECP256R1()),
+        "RS256": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    }
+    return {
+        alg: key.private_bytes(
+            Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()
+        ).decode()
+        for alg, key in keys.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    secret = os.environ["JWT_SECRET"]
+    token = generate_token(identity=uuid.uuid4(), token_type="access")
+    uncached = JWTCodec(secret=secret, cache_size=0)
+    cached = JWTCodec(secret=secret)
+    cached.decode(token)
+
+    cases = {
+        "jose + pydantic (before)": lambda: jose_decode(token, secret),
+        "JWTCodec, cold cache": lambda: uncached.decode(token),
+        "JWTCodec, cached": lambda: cached.decode(token),
+    }
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=args.number, repeat=5))
+        print(f"{name:<28} {best / args.number * 1e6:8.2f} us/decode")
+
+    # RSA signatures cost a millisecond or so, fewer rounds
+    number = max(args.number // 10, 10)
+    claims = {"identity": str(uuid.uuid4()), "exp": 2**31, "type": "access"}
+    for alg, pem in generate_pems().items():
+        codec = JWTCodec(signing_key=load_pem_key(pem), cache_size=0)
+        token = codec.encode(claims)
+        for name, fn in (
+            (f"{alg} encode", lambda: codec.encode(claims)),
+            (f"{alg} decode, cold cache", lambda: codec.decode(token)),
+        ):
+            best = min(timeit.repeat(fn, number=number, repeat=3))
+            print(f"{name:<28} {best / number * 1e6:8.2f} us/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Admin user search: latency per page over a large seeded user table.
+
+Seeds the database from .env (see benchmarks/README.md) with synthetic users
+straight through SQL, skipping signup and bcrypt, then walks --pages pages of
+search_users for a few query shapes and reports p50/p95/max per page. Keyset
+pages should cost the same however deep the walk goes, "last" is the
+deepest page reached.
+
+    python -m benchmarks.bench_search --users 2000000 --pages 20
+    python -m benchmarks.bench_search --explain     # plans of the first pages
+    python -m benchmarks.bench_search --cleanup     # delete the seeded users
+
+Needs the migrations applied (pg_trgm and the search indexes). Seeded users
+share the @bench-search.example email domain, a later run tops them up to
+--users instead of seeding again.
+"""
+
+from statistics import median
+from typing import List
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from benchmarks.load import percentile
+
+DOMAIN = "bench-search.example"
+
+FIRST_NAMES = [
+    "james", "mary", "john", "patricia", "robert", "jennifer", "michael",
+    "linda", "william", "elizabeth", "david", "barbara", "richard", "susan",
+    "joseph", "jessica", "thomas", "sarah", "charles", "karen", "mark",
+    "nancy", "daniel", "lisa", "matthew", "betty", "anthony", "margaret",
+    "donald", "sandra", "steven", "ashley", "paul", "kimberly", "andrew",
+    "emily", "joshua", "donna", "kenneth", "michelle",
+]  # fmt: skip
+LAST_NAMES = [
+    "smith", "johnson", "williams", "brown", "jones", "garcia", "miller",
+    "davis", "rodriguez", "martinez", "hernandez", "lopez", "gonzalez",
+    "wilson", "anderson", "thomas", "taylor", "moore", "jackson", "martin",
+    "lee", "perez", "thompson", "white", "harris", "sanchez", "clark",
+    "ramirez", "lewis", "robinson", "walker", "young", "allen", "king",
+    "wright", "scott", "torres", "nguyen", "hill", "flores",
+]  # fmt: skip
+
+# one round trip per batch, created_at spread over the past so pages differ
+SEED_SQL = f"""
+INSERT INTO "user" (
+    id, first_name, last_name, username, email, password_hash, is_active,
+    is_email_verified, is_admin, token_version, last_profile_updated_at,
+    last_password_updated_at, created_at, updated_at
+)
+SELECT
+    gen_random_uuid(),
+    (CAST(:first_names AS text[]))[1 + i % {len(FIRST_NAMES)}],
+    (CAST(:last_names AS text[]))[1 + (i / {len(FIRST_NAMES)}) % {len(LAST_NAMES)}],
+    'bsu' || i,
+    'bsu' || i || '@{DOMAIN}',
+    'not-a-hash',
+    true, false, false, 0, now(), now(),
+    now() - make_interval(secs => i),
+    now()
+FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint) - 1) AS i
+"""
+
+# (name, query, prefix)
+CASES = [
+    ("newest", "", False),
+    ("common substring", "son", False),
+    ("rare substring", "bsu12345@", False),
+    ("prefix", "mar", True),
+    ("short prefix", "jo", False),
+    ("no match", "zzqx", False),
+]
+
+
+async def seed(users: int, batch: int) -> None:
+    from app.core.db import get_async_engine
+
+    engine = get_async_engine()
+    async with engine.connect() as conn:
+        start = (
+            await conn.execute(
+                text(f"SELECT count(*) FROM \"user\" WHERE email LIKE '%@{DOMAIN}'")
+            )
+        ).scalar_one()
+    if start >= users:
+        print(f"{start} users already seeded")
+        return
+
+    started = time.perf_counter()
+    for offset in range(start, users, batch):
+        stop = min(offset + batch, users)
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(SEED_SQL),
+                {
+                    "first_names": FIRST_NAMES,
+                    "last_names": LAST_NAMES,
+                    "start": offset,
+                    "stop": stop,
+                },
+            )
+        print(f"seeded {stop}/{users}", end="\r")
+    async with engine.begin() as conn:
+        await conn.execute(text('ANALYZE "user"'))
+    print(f"seeded {users - start} users in {time.perf_counter() - started:.0f}s")
+
+
+async def walk(query: str, prefix: bool, pages: int, limit: int) -> List[float]:
+    from app.core.db import async_read_session_maker
+    from app.repositories.user_repo import search_users
+
+    latencies = []
+    after = None
+    async with async_read_session_maker() as session:
+        for _ in range(pages):
+            started = time.perf_counter()
+            rows = await search_users(
+                session=session, query=query, limit=limit, prefix=prefix, after=after
+            )
+            latencies.append(time.perf_counter() - started)
+            if len(rows) < limit:
+                break
+            after = (rows[-1].created_at, rows[-1].id)
+    return latencies
+
+
+async def explain(query: str, prefix: bool, limit: int) -> str:
+    from app.core.db import get_async_engine
+    from app.repositories.user_repo import search_users_statement
+
+    statement = search_users_statement(query=query, limit=limit, prefix=prefix)
+    async with get_async_engine().connect() as conn:
+        # the connected dialect knows how the server wants literals escaped
+        sql = statement.compile(
+            dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+        )
+        result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")
+        return "\n".join(row[0] for row in result)
+
+
+async def run(args) -> None:
+    from app.core.db import dispose_engines
+
+    try:
+        if args.cleanup:
+            from app.core.db import get_async_engine
+
+            async with get_async_engine().begin() as conn:
+                await conn.execute(
+                    text(f"DELETE FROM \"user\" WHERE email LIKE '%@{DOMAIN}'")
+                )
+            print("deleted the seeded users")
+            return
+
+        await seed(args.users, args.batch)
+
+        print(f"{'case':<18} {'pages':>5} {'p50':>9} {'p95':>9} {'max':>9} {'last':>9}")
+        for name, query, prefix in CASES:
+            latencies = await walk(query, prefix, args.pages, args.limit)
+            ordered = sorted(latencies)
+            print(
+                f"{name:<18} {len(latencies):>5} "
+                f"{median(ordered) * 1000:7.2f}ms "
+                f"{percentile(ordered, 95) * 1000:7.2f}ms "
+                f"{ordered[-1] * 1000:7.2f}ms "
+                f"{latencies[-1] * 1000:7.2f}ms"
+            )
+
+        if args.explain:
+            for name, query, prefix in CASES:
+                print(f"\n-- {name}: {query!r}")
+                print(await explain(query, prefix, args.limit))
+    finally:
+        await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=100000)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--explain", action="store_true")
+    parser.add_argument("--cleanup", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
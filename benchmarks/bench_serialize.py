@@ -0,0 +1,91 @@
+"""
+Per-response cost of the profile body: serializing the user and rendering JSON.
+
+Compares the previous path (serialize_user calling get_full_name and three
+.timestamp() per call, rendered by the stdlib-json JSONResponse) with the
+attrgetter serializer on an ORM row and the memoized one on a cached
+Principal, both rendered by app.core.responses.JSONResponse.
+
+    python -m benchmarks.bench_serialize [--number 20000]
+"""
+
+from datetime import datetime, timezone
+import argparse
+import os
+import timeit
+import uuid
+
+# serialize_user lives in a router module, which imports the db module;
+# nothing connects, placeholder settings are enough to import it
+for _name, _value in {
+    "POSTGRES_USER": "bench",
+    "POSTGRES_PASSWORD": "bench",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "bench",
+    "JWT_SECRET": "benchmark-secret",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from starlette.responses import JSONResponse as StdlibJSONResponse
+
+from app.core.principal import Principal
+from app.core.responses import JSONResponse, orjson
+from app.models.user import User
+from app.routers.user import serialize_user
+
+
+def serialize_user_before(user) -> dict:
+    return {
+        "id": str(user.id),
+        "full_name": user.get_full_name(),
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "username": user.username,
+        "is_email_verified": user.is_email_verified,
+        "joined_at": int(user.created_at.timestamp()),
+        "last_profile_updated_at": int(user.last_profile_updated_at.timestamp()),
+        "last_password_updated_at": int(user.last_password_updated_at.timestamp()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    user = User(
+        id=uuid.uuid4(),
+        first_name="ada",
+        last_name="lovelace",
+        username="ada",
+        email="ada@example.com",
+        password_hash="x",
+        is_active=True,
+        is_email_verified=True,
+        last_profile_updated_at=now,
+        last_password_updated_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    principal = Principal.from_user(user)
+
+    cases = {
+        "stdlib json, per-call dict (before)": lambda: StdlibJSONResponse(
+            {"user": serialize_user_before(principal)}
+        ),
+        "JSONResponse, ORM row": lambda: JSONResponse({"user": serialize_user(user)}),
+        "JSONResponse, cached principal": lambda: JSONResponse(
+            {"user": serialize_user(principal)}
+        ),
+    }
+    print(f"encoder: {'orjson' if orjson is not None else 'stdlib json'}")
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=args.number, repeat=5))
+        print(f"{name:<38} {best / args.number * 1e6:8.2f} us/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Websocket gateway capacity: memory per idle connection and fan-out cost.
+
+`fanout` runs the ConnectionManager in-process against stub sockets that
+accept every frame, so it needs no server or database. It reports the
+memory held per connection (queue, writer task and bookkeeping), the time a
+broadcast takes to queue one frame for everyone, the time for the writers to
+drain it, and the cost of a heartbeat sweep.
+
+`idle` boots `python -m app` with one worker, logs a seeded user in and opens
+N real connections with that user's access cookie. It reports the worker's
+RSS growth per connection and how long a profile update takes to reach all
+of them. It needs the database from benchmarks/README.md and enough file
+descriptors, both for the server and this process (`ulimit -n`).
+
+    python -m benchmarks.bench_websocket fanout --connections 50000
+    python -m benchmarks.bench_websocket idle --connections 20000
+"""
+
+from statistics import median
+from uuid import uuid4
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.load import ROOT, PASSWORD, user_payload, wait_until_ready
+
+
+class StubWebSocket:
+    """
+    Takes frames as fast as they come, like a client on an idle fast link.
+    """
+
+    def __init__(self):
+        self.frames = 0
+
+    async def send_text(self, frame: str) -> None:
+        self.frames += 1
+
+
+async def fanout(connections: int, users: int, rounds: int) -> None:
+    from app.core.jwt import TokenPayload
+    from app.core.websocket import ConnectionManager
+
+    manager = ConnectionManager(queue_size=64)
+    user_ids = [uuid4() for _ in range(users)]
+    exp = int(time.time()) + 3600
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    opened = []
+    for i in range(connections):
+        payload = TokenPayload(identity=user_ids[i % users], exp=exp, type="access")
+        connection = manager.add(StubWebSocket(), "token", payload)
+        connection._writer = asyncio.create_task(connection._write())
+        opened.append(connection)
+    # let every writer reach its first queue.get()
+    await asyncio.sleep(0)
+    gc.collect()
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+    tracemalloc.stop()
+
+    message = {"type": "announcement", "body": "x" * 200}
+    queued, drained, heartbeats = [], [], []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        manager.broadcast(message)
+        queued.append(time.perf_counter() - started)
+        while any(c.pending() for c in opened):
+            await asyncio.sleep(0)
+        drained.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        manager.heartbeat(idle_timeout=0)
+        heartbeats.append(time.perf_counter() - started)
+        while any(c.pending() for c in opened):
+            await asyncio.sleep(0)
+
+    for connection in opened:
+        connection._writer.cancel()
+    await asyncio.gather(*(c._writer for c in opened), return_exceptions=True)
+
+    print(f"{connections} connections over {users} users")
+    print(f"memory       {per_connection / 1024:8.2f} KiB per connection")
+    for name, values in (
+        ("broadcast", queued),
+        ("delivered", drained),
+        ("heartbeat", heartbeats),
+    ):
+        print(
+            f"{name:<12} {median(values) * 1000:8.2f} ms   "
+            f"{median(values) / connections * 1e6:6.2f} us per connection"
+        )
+
+
+def raise_fd_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def worker_pid(parent: int) -> int:
+    with open(f"/proc/{parent}/task/{parent}/children") as f:
+        return int(f.read().split()[0])
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def login(base_url: str) -> tuple:
+    payload = user_payload(0, f"ws{int(time.time())}")
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        await http.post("/auth/signup", json=payload)
+        response = await http.post(
+            "/auth/login", json={"email": payload["email"], "password": PASSWORD}
+        )
+        response.raise_for_status()
+        return response.cookies["access"], payload["username"]
+
+
+async def idle(base_url: str, server_pid: int, connections: int, batch: int) -> None:
+    from websockets.asyncio.client import connect
+
+    access, username = await login(base_url)
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/"
+    headers = {"cookie": f"access={access}"}
+    pid = worker_pid(server_pid)
+    await asyncio.sleep(1)
+    rss_before = rss_kib(pid)
+
+    received = asyncio.Event()
+    pending = connections
+    sockets = []
+
+    async def listen(ws):
+        nonlocal pending
+        async for message in ws:
+            if message == '{"type":"ping"}':
+                await ws.send('{"type":"pong"}')
+            elif message.startswith('{"type":"profile.updated"'):
+                pending -= 1
+                if not pending:
+                    received.set()
+
+    started = time.perf_counter()
+    for offset in range(0, connections, batch):
+        count = min(batch, connections - offset)
+        opened = await asyncio.gather(
+            *(
+                connect(ws_url, additional_headers=headers, compression=None)
+                for _ in range(count)
+            )
+        )
+        sockets.extend(opened)
+    connect_seconds = time.perf_counter() - started
+    listeners = [asyncio.create_task(listen(ws)) for ws in sockets]
+
+    await asyncio.sleep(2)
+    rss_after = rss_kib(pid)
+
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        started = time.perf_counter()
+        response = await http.patch(
+            "/user/profile/update/",
+            json={"first_name": "fan", "last_name": "out", "username": username},
+            headers=headers,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"update failed: {response.status_code} {response.text}")
+        await asyncio.wait_for(received.wait(), timeout=60)
+        fanout_seconds = time.perf_counter() - started
+
+    for task in listeners:
+        task.cancel()
+    await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+
+    print(f"{connections} idle connections on one worker")
+    print(f"connect      {connections / connect_seconds:8.0f} connections/s")
+    print(
+        f"worker rss   {rss_before / 1024:8.1f} MiB -> {rss_after / 1024:.1f} MiB, "
+        f"{(rss_after - rss_before) / connections:.1f} KiB per connection"
+    )
+    print(f"fan-out      {fanout_seconds * 1000:8.1f} ms update to last delivery")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("mode", choices=("fanout", "idle"))
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000, help="fanout only")
+    parser.add_argument("--rounds", type=int, default=5, help="fanout only")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--batch", type=int, default=500, help="connections opened at once"
+    )
+    args = parser.parse_args()
+
+    if args.mode == "fanout":
+        asyncio.run(fanout(args.connections, args.users, args.rounds))
+        return
+
+    limit = raise_fd_limit()
+    if limit < args.connections + 100:
+        print(f"warning: only {limit} file descriptors allowed", file=sys.stderr)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "app",
+            "--port",
+            str(args.port),
+            "--workers",
+            "1",
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=dict(os.environ, RATE_LIMIT_ENABLED="false"),
+        preexec_fn=raise_fd_limit,
+    )
+    try:
+        wait_until_ready(base_url, timeout=60)
+        asyncio.run(idle(base_url, server.pid, args.connections, args.batch))
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    main()
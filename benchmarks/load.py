@@ -0,0 +1,306 @@
+"""
+End-to-end load benchmark for the auth and profile flows.
+
+Boots the app with uvicorn against the database configured in .env (see
+benchmarks/README.md), seeds users through /auth/signup and then drives
+concurrent clients through login -> profile -> profile update -> refresh ->
+logout sessions. Throughput and p50/p95/p99 latency per endpoint are written
+to a JSON report so runs can be compared.
+
+    python -m benchmarks.load --users 200 --concurrency 50 --duration 60
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Union
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "Bench#Passw0rd"
+
+
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.latencies.append(seconds)
+        if not ok:
+            self.errors += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class Client:
+    """
+    Thin wrapper that times every call and carries the auth cookies by hand,
+    the app marks them Secure so httpx would not send them over plain http.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, stats: Dict[str, EndpointStats]):
+        self.http = http
+        self.stats = stats
+        self.cookies: Dict[str, str] = {}
+
+    async def call(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        headers = kwargs.pop("headers", {})
+        if self.cookies:
+            headers["cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        started = time.perf_counter()
+        response = await self.http.request(method, url, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        self.stats.setdefault(name, EndpointStats()).record(
+            elapsed, response.status_code < 400
+        )
+        for key in ("access", "refresh"):
+            if key in response.cookies:
+                self.cookies[key] = response.cookies[key]
+        return response
+
+
+def user_payload(index: int, run_id: str) -> dict:
+    return {
+        "first_name": "bench",
+        "last_name": f"user{index}",
+        "username": f"bench{run_id}u{index}",
+        "email": f"bench{run_id}u{index}@example.com",
+        "password": PASSWORD,
+        "password_repeat": PASSWORD,
+    }
+
+
+async def seed_users(http: httpx.AsyncClient, count: int, run_id: str) -> List[dict]:
+    users = [user_payload(i, run_id) for i in range(count)]
+    semaphore = asyncio.Semaphore(16)
+
+    async def signup(payload: dict):
+        async with semaphore:
+            response = await http.post("/auth/signup", json=payload)
+            if response.status_code not in (201, 400):
+                raise RuntimeError(
+                    f"seeding failed: {response.status_code} {response.text}"
+                )
+
+    await asyncio.gather(*(signup(u) for u in users))
+    return users
+
+
+async def run_session(client: Client, user: dict, profile_reads: int) -> None:
+    response = await client.call(
+        "POST /auth/login",
+        "POST",
+        "/auth/login",
+        json={"email": user["email"], "password": PASSWORD},
+    )
+    if response.status_code != 200:
+        return
+
+    for _ in range(profile_reads):
+        await client.call("GET /user/profile/", "GET", "/user/profile/")
+
+    await client.call(
+        "PATCH /user/profile/update/",
+        "PATCH",
+        "/user/profile/update/",
+        json={
+            "first_name": user["first_name"],
+            "last_name": f"{user['last_name']}x{int(time.time() * 1000) % 1000}",
+            "username": user["username"],
+        },
+    )
+    await client.call("GET /auth/refresh-token", "GET", "/auth/refresh-token")
+    await client.call("GET /user/profile/logout", "GET", "/user/profile/logout")
+    client.cookies.clear()
+
+
+async def drive(
+    base_url: str,
+    users: int,
+    concurrency: int,
+    duration: float,
+    profile_reads: int,
+    run_id: str,
+) -> dict:
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        seeded = await seed_users(http, users, run_id)
+        stats: Dict[str, EndpointStats] = {}
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user(index: int):
+            client = Client(http, stats)
+            n = index
+            while time.perf_counter() < deadline:
+                await run_session(client, seeded[n % len(seeded)], profile_reads)
+                n += concurrency
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name, endpoint in sorted(stats.items()):
+        values = sorted(endpoint.latencies)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": endpoint.errors,
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "total_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def git_revision() -> Union[str, None]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def start_server(host: str, port: int, workers: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            host,
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        # every simulated user signs up and logs in from 127.0.0.1
+        env=dict(os.environ, RATE_LIMIT_ENABLED="false"),
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float = 30, interval: float = 0.2) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ping", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise RuntimeError(f"server at {base_url} did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="benchmark a running server instead of booting one",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=100, help="users to seed")
+    parser.add_argument(
+        "--concurrency", type=int, default=50, help="concurrent clients"
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument(
+        "--profile-reads", type=int, default=5, help="profile reads per session"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="report path, default benchmarks/results/load-<time>.json",
+    )
+    args = parser.parse_args()
+
+    run_id = str(int(time.time()))
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url = f"http://{args.host}:{args.port}"
+        server = start_server(args.host, args.port, args.workers)
+
+    try:
+        wait_until_ready(base_url)
+        results = asyncio.run(
+            drive(
+                base_url=base_url,
+                users=args.users,
+                concurrency=args.concurrency,
+                duration=args.duration,
+                profile_reads=args.profile_reads,
+                run_id=run_id,
+            )
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "benchmark": "load",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "config": {
+            "base_url": base_url,
+            "workers": args.workers if server else None,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "profile_reads": args.profile_reads,
+        },
+        **results,
+    }
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"load-{run_id}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{'endpoint':<28} {'req':>7} {'err':>5} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}"
+    )
+    for name, e in report["endpoints"].items():
+        print(
+            f"{name:<28} {e['requests']:>7} {e['errors']:>5} {e['rps']:>9} "
+            f"{e['p50_ms']:>7}ms {e['p95_ms']:>7}ms {e['p99_ms']:>7}ms"
+        )
+    print(f"total {report['total_rps']} req/s, report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
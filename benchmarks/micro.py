@@ -0,0 +1,188 @@
+"""
+Microbenchmarks for the functions that run on every request.
+
+Each case is timed with timeit: the loop count is calibrated so one repeat
+takes at least --min-time seconds, and the best of --repeat runs is kept,
+which is the most stable estimate on a noisy machine.
+
+    python -m benchmarks.micro                       # print timings
+    python -m benchmarks.micro --save                # store them as the baseline
+    python -m benchmarks.micro --compare             # fail on regressions
+    python -m benchmarks.micro --compare --threshold 0.25 -k token
+
+Baselines are machine specific, record and compare them on the same host.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, Dict
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+
+# serialize_user lives in a router module, which imports the db module;
+# nothing connects, placeholder settings are enough to import it
+for _name, _value in {
+    "POSTGRES_USER": "bench",
+    "POSTGRES_PASSWORD": "bench",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "bench",
+    "JWT_SECRET": "benchmark-secret",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from app.core.conditional import is_not_modified
+from app.core.jwt import JWTCodec, generate_token
+from app.core.principal import Principal
+from app.core.security import get_pwd_context
+from app.models.user import User
+from app.core.responses import dumps
+from app.routers.user import serialize_user
+from app.schemas.user import (
+    PASSWORD_VALIDATION_REGEX,
+    SignupRequestSchema,
+    UpdateProfileRequestSchema,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "results", "micro-baseline.json")
+
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    secret = os.environ["JWT_SECRET"]
+    identity = uuid.uuid4()
+    token = generate_token(identity=identity, token_type="access")
+    cold_codec = JWTCodec(secret=secret, cache_size=0)
+    warm_codec = JWTCodec(secret=secret)
+    warm_codec.decode(token)
+
+    now = datetime.now(timezone.utc)
+    password = "Bench#Passw0rd"
+    user = User(
+        id=identity,
+        first_name="ada",
+        last_name="lovelace",
+        username="ada",
+        email="ada@example.com",
+        password_hash=get_pwd_context().hash(password),
+        is_active=True,
+        is_email_verified=True,
+        last_profile_updated_at=now,
+        last_password_updated_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    principal = Principal.from_user(user)
+    password_hash = user.password_hash
+    revalidation = {"if-none-match": principal.validators()["ETag"]}
+
+    return {
+        "decode_token.cold": lambda: cold_codec.decode(token),
+        "decode_token.cached": lambda: warm_codec.decode(token),
+        "generate_token": lambda: generate_token(
+            identity=identity, token_type="access"
+        ),
+        "serialize_user.orm": lambda: serialize_user(user),
+        "serialize_user.principal": lambda: serialize_user(principal),
+        "render_profile": lambda: dumps({"user": serialize_user(principal)}),
+        "profile_not_modified": lambda: is_not_modified(
+            revalidation, principal.validators()["ETag"], principal.updated_at
+        ),
+        "SignupRequestSchema.normalize_identifiers": lambda: SignupRequestSchema.normalize_identifiers(
+            "  Ada Love Lace  "
+        ),
+        "UpdateProfileRequestSchema.normalize_identifiers": lambda: UpdateProfileRequestSchema.normalize_identifiers(
+            "  Ada Love Lace  "
+        ),
+        "User._normalize_identifiers": lambda: User._normalize_identifiers(
+            "  Ada Love Lace  "
+        ),
+        "PASSWORD_VALIDATION_REGEX": lambda: PASSWORD_VALIDATION_REGEX.fullmatch(
+            password
+        ),
+        "verify_password": lambda: get_pwd_context().verify(password, password_hash),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int, min_time: float) -> float:
+    """
+    Returns the best seconds per call over `repeat` runs.
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-k", default="", help="only run cases containing this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store results as the baseline"
+    )
+    parser.add_argument(
+        "--compare", action="store_true", help="compare against the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown before --compare fails (0.2 = 20%%)",
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    for name, fn in build_cases().items():
+        if args.k not in name:
+            continue
+        seconds = measure(fn, repeat=args.repeat, min_time=args.min_time)
+        results[name] = seconds
+
+        line = f"{name:<50} {seconds * 1e6:12.3f} us"
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += f"  {change:+7.1%}"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "unit": "seconds per call",
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"baseline written to {args.baseline}")
+
+    if regressions:
+        print(
+            f"{len(regressions)} case(s) regressed more than {args.threshold:.0%}: "
+            + ", ".join(regressions)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Cold start benchmark: import time of app.main and time to the first response.
+
+Every run is a fresh interpreter. "import" is the wall time of
+`python -c "import app.main"` minus a bare `python -c pass`; "boot" is the
+time from spawning uvicorn until /ping answers, lifespan included.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --create-all      # boot with create_all on
+    python -m benchmarks.startup --top 15          # slowest imports too
+
+Booting needs the settings in .env; with create_all off the app serves
+requests even when the database is unreachable, so boot numbers don't
+depend on one.
+"""
+
+from statistics import median
+from typing import List
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+from benchmarks.load import ROOT, wait_until_ready
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def timed_run(code: str, env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - started
+
+
+def boot_once(port: int, env: dict) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--no-access-log",
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}", timeout=60, interval=0.01)
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(env: dict, top: int) -> List[tuple]:
+    """
+    Slowest modules imported by app.main, by cumulative time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            rows.append((int(cumulative), len(indent), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def summary(values: List[float]) -> str:
+    return f"median {median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--create-all",
+        action="store_true",
+        help="boot with DB_CREATE_ALL on (needs the database)",
+    )
+    parser.add_argument("--top", type=int, default=0, help="show the slowest imports")
+    args = parser.parse_args()
+
+    env = dict(os.environ, DB_CREATE_ALL="true" if args.create_all else "false")
+
+    interpreter = [timed_run("pass", env) for _ in range(args.runs)]
+    imports = [
+        timed_run("import app.main", env) - median(interpreter)
+        for _ in range(args.runs)
+    ]
+    boots = [boot_once(args.port, env) for _ in range(args.runs)]
+
+    print(f"{'interpreter':<12} {summary(interpreter)}")
+    print(f"{'import':<12} {summary(imports)}")
+    print(f"{'boot':<12} {summary(boots)}")
+
+    if args.top:
+        print()
+        for cumulative, depth, name in slowest_imports(env, args.top):
+            print(f"{cumulative / 1000:8.1f} ms  {' ' * (depth - 1)}{name}")
+
+
+if __name__ == "__main__":
+    main()